@@ -0,0 +1,232 @@
+import os
+import json
+import glob
+import random
+import logging
+import argparse
+import subprocess
+
+from episode import hash_file
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Paths
+# -------------------------
+CLIPS_DIR = "clips"
+MUSIC_DIR = "music"
+ASSETS_DIR = "assets"
+INDEX_FILE = os.path.join(ASSETS_DIR, "index.json")
+
+# -------------------------
+# Canonical clip format (matches the render output)
+# -------------------------
+CLIP_WIDTH = 1920
+CLIP_HEIGHT = 1080
+CLIP_FPS = 30
+CLIP_PIX_FMT = "yuv420p"
+
+
+# -------------------------
+# Probing
+# -------------------------
+def probe(path: str) -> dict:
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", "format=duration:stream=codec_type,nb_frames",
+            "-of", "json",
+            path,
+        ],
+        check=True,
+        text=True,
+        stdout=subprocess.PIPE
+    )
+    info = json.loads(result.stdout)
+
+    frames = None
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == "video" and stream.get("nb_frames"):
+            frames = int(stream["nb_frames"])
+
+    return {
+        "duration": float(info["format"]["duration"]),
+        "frames": frames,
+    }
+
+
+# -------------------------
+# Index
+# -------------------------
+def load_index() -> dict | None:
+    if not os.path.exists(INDEX_FILE):
+        return None
+
+    with open(INDEX_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index(index: dict):
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    tmp_path = INDEX_FILE + ".tmp"
+
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+
+    os.replace(tmp_path, INDEX_FILE)
+
+
+def asset_id(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# -------------------------
+# Ingestion
+# -------------------------
+def transcode_clip(source: str, target: str):
+    video_filter = (
+        f"scale={CLIP_WIDTH}:{CLIP_HEIGHT}:force_original_aspect_ratio=increase,"
+        f"crop={CLIP_WIDTH}:{CLIP_HEIGHT},"
+        f"fps={CLIP_FPS},"
+        f"format={CLIP_PIX_FMT}"
+    )
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-i", source,
+        "-vf", video_filter,
+        "-an",
+        "-c:v", "libx264",
+        "-preset", "slow",
+        "-crf", "18",
+        # One keyframe per second keeps looped/segment seeks cheap
+        "-g", str(CLIP_FPS),
+        "-movflags", "+faststart",
+        target,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+
+def ingest(force: bool = False) -> dict:
+    previous = load_index() or {"clips": [], "music": []}
+    known = {
+        entry["source_checksum"]: entry
+        for entry in previous["clips"]
+        if os.path.exists(entry["path"])
+    }
+
+    clips_out = os.path.join(ASSETS_DIR, "clips")
+    os.makedirs(clips_out, exist_ok=True)
+
+    clips = []
+    for source in sorted(glob.glob(os.path.join(CLIPS_DIR, "*.mp4"))):
+        source_checksum = hash_file(source)
+
+        if not force and source_checksum in known:
+            logger.info("Clip up to date: %s", source)
+            clips.append(known[source_checksum])
+            continue
+
+        target = os.path.join(clips_out, os.path.basename(source))
+        logger.info("Transcoding clip: %s -> %s", source, target)
+        transcode_clip(source, target)
+
+        clips.append({
+            "id": asset_id(source),
+            "source": source,
+            "source_checksum": source_checksum,
+            "path": target,
+            "checksum": hash_file(target),
+            **probe(target),
+        })
+
+    music = []
+    for source in sorted(glob.glob(os.path.join(MUSIC_DIR, "*.mp3"))):
+        logger.info("Indexing music: %s", source)
+        music.append({
+            "id": asset_id(source),
+            "path": source,
+            "checksum": hash_file(source),
+            **probe(source),
+        })
+
+    index = {
+        "format": {
+            "width": CLIP_WIDTH,
+            "height": CLIP_HEIGHT,
+            "fps": CLIP_FPS,
+            "pix_fmt": CLIP_PIX_FMT,
+        },
+        "clips": clips,
+        "music": music,
+    }
+    save_index(index)
+
+    logger.info("Indexed %d clips, %d music tracks", len(clips), len(music))
+    return index
+
+
+# -------------------------
+# Registry
+# Falls back to scanning the raw folders when nothing is ingested yet.
+# Index entries whose file is gone are skipped.
+# -------------------------
+def list_assets(kind: str) -> list:
+    source_dir = CLIPS_DIR if kind == "clips" else MUSIC_DIR
+
+    index = load_index()
+    if index and index.get(kind):
+        stale = (
+            os.path.isdir(source_dir)
+            and os.path.getmtime(source_dir) > os.path.getmtime(INDEX_FILE)
+        )
+        if stale:
+            logger.warning("%s changed since the last ingest; run assets.py", source_dir)
+
+        present = [entry for entry in index[kind] if os.path.exists(entry["path"])]
+        if present:
+            return present
+        logger.warning("No indexed %s on disk, scanning %s", kind, source_dir)
+
+    if kind == "clips":
+        pattern = os.path.join(CLIPS_DIR, "*.mp4")
+    else:
+        pattern = os.path.join(MUSIC_DIR, "*.mp3")
+
+    return [
+        {"id": asset_id(path), "path": path}
+        for path in sorted(glob.glob(pattern))
+    ]
+
+
+def pick_asset(kind: str) -> dict:
+    assets = list_assets(kind)
+    if not assets:
+        raise RuntimeError(f"No {kind} assets found")
+    return random.choice(assets)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Normalize background clips and index clip/music assets"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-transcode clips even if the source is unchanged"
+    )
+    args = parser.parse_args()
+
+    index = ingest(force=args.force)
+
+    for clip in index["clips"]:
+        print(f"clip  {clip['id']}: {clip['duration']:.2f}s {clip['frames']} frames")
+    for track in index["music"]:
+        print(f"music {track['id']}: {track['duration']:.2f}s")
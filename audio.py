@@ -7,9 +7,23 @@ import re
 import logging
 import string
 import sys
+import argparse
+import subprocess
 from urllib.parse import unquote, quote
 from collections import Counter
 import os
+import json
+
+import frontend
+import profiling
+from episode import (
+    episode_dir,
+    load_manifest,
+    stage_valid,
+    record_stage,
+    stage_entry,
+    hash_file,
+)
 
 # -------------------------
 # Logging setup
@@ -23,10 +37,24 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # -------------------------
-# Paths
+# TTS
 # -------------------------
-TEMP_DIR = "temp"
-os.makedirs(TEMP_DIR, exist_ok=True)
+MODEL_NAME = "tts_models/en/vctk/vits"
+SPEAKER = "p232"
+
+VIDEO_SCRIPT = "video.py"
+
+# -------------------------
+# Narration length model (SPEAKER runs ~14.5 chars/s)
+# The bound uses a slower rate plus headroom so a background
+# pre-rendered from it always outlasts the narration.
+# -------------------------
+PREDICT_CHARS_PER_SECOND = 12.0
+PREDICT_MARGIN_SECONDS = 10.0
+
+# x264 threads for the pre-render; the "prerender" lease takes these
+# out of torch's share
+PRERENDER_THREADS = 2
 
 # -------------------------
 # Env
@@ -120,63 +148,56 @@ def detect_primary_substance(content: str, doses: list) -> str:
     return "Unknown"
 
 # -------------------------
-# Parse experience URL
+# Fetch random experience
 # -------------------------
-experience_url = None
-if len(sys.argv) > 1:
-    experience_url = unquote(sys.argv[1])
-    logger.info("Using provided experience URL: %s", experience_url)
+SUBSTANCE_PAGES = [
+    "https://www.erowid.org/chemicals/dmt/dmt.shtml",
+    "https://www.erowid.org/chemicals/lsd/lsd.shtml",
+    "https://www.erowid.org/plants/salvia/salvia.shtml",
+    "https://www.erowid.org/plants/cannabis/cannabis.shtml",
+    "https://www.erowid.org/chemicals/mdma/mdma.shtml",
+    "https://www.erowid.org/chemicals/heroin/heroin.shtml",
+    "https://www.erowid.org/chemicals/cocaine/cocaine.shtml",
+    "https://www.erowid.org/chemicals/ketamine/ketamine.shtml",
+]
 
-# -------------------------
-# Fetch random experience if no URL
-# -------------------------
-if not experience_url:
+def fetch_random_experience_url() -> str:
     url = f"{LYSERGIC_API}/api/v1/erowid/random/experience?size_per_substance=1"
-    substances = {
-        "urls": [
-            "https://www.erowid.org/chemicals/dmt/dmt.shtml",
-            "https://www.erowid.org/chemicals/lsd/lsd.shtml",
-            "https://www.erowid.org/plants/salvia/salvia.shtml",
-            "https://www.erowid.org/plants/cannabis/cannabis.shtml",
-            "https://www.erowid.org/chemicals/mdma/mdma.shtml",
-            "https://www.erowid.org/chemicals/heroin/heroin.shtml",
-            "https://www.erowid.org/chemicals/cocaine/cocaine.shtml",
-            "https://www.erowid.org/chemicals/ketamine/ketamine.shtml",
-        ]
-    }
-    experience = requests.post(url, json=substances).json()
-    experience_url = experience["experience"]["url"]
+    experience = requests.post(url, json={"urls": SUBSTANCE_PAGES}).json()
+    return experience["experience"]["url"]
 
 # -------------------------
 # Fetch experience details
 # -------------------------
-resp = requests.post(
-    f"{LYSERGIC_API}/api/v1/erowid/experience",
-    json={"url": experience_url}
-)
-data = resp.json()["data"]
+def fetch_experience(work_dir: str, manifest: dict, experience_url: str) -> dict:
+    experience_file = os.path.join(work_dir, "experience.json")
+    experience_inputs = {"url": experience_url}
 
-clean_experience = {
-    "title": data["title"],
-    "username": data["author"],
-    "gender": data["metadata"].get("gender", "Unknown"),
-    "age": data["metadata"].get("age", "Unknown"),
-    "content": data["content"],
-    "doses": data.get("doses", []),
-}
+    if stage_valid(manifest, "experience", experience_inputs):
+        with open(experience_file, "r", encoding="utf-8") as f:
+            return json.load(f)
 
-# -------------------------
-# Detect primary substance
-# -------------------------
-primary_substance = detect_primary_substance(
-    clean_experience["content"],
-    clean_experience["doses"]
-)
+    resp = requests.post(
+        f"{LYSERGIC_API}/api/v1/erowid/experience",
+        json={"url": experience_url}
+    )
+    data = resp.json()["data"]
+
+    with open(experience_file, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    record_stage(
+        work_dir, manifest, "experience",
+        experience_inputs,
+        {"experience": experience_file},
+    )
+    return data
 
 # -------------------------
 # Build narration script
 # -------------------------
-tts_script = f"""
+def build_script(clean_experience: dict, primary_substance: str) -> str:
+    return f"""
 Welcome.
 
 This is a narrated experience report sourced from Erowid dot org,
@@ -199,82 +220,366 @@ Reported gender: {clean_experience['gender']}.
 Thank you for listening.
 """
 
-segments = split_with_punctuation(normalize_text(tts_script))
-
 # -------------------------
 # Load TTS
 # -------------------------
-tts = TTS(
-    model_name="tts_models/en/vctk/vits",
-    progress_bar=False,
-    gpu=False
-)
-
-speaker = "p232"
-sr = tts.synthesizer.output_sample_rate
+def load_tts():
+    if os.getenv("TTS_STUB"):
+        from loadtest import StubTTS
+        return StubTTS()
+
+    return TTS(
+        model_name=MODEL_NAME,
+        progress_bar=False,
+        gpu=False
+    )
 
 # -------------------------
 # Generate audio + subtitles
+# Samples go to emit(); cues are flushed as they are synthesized so the
+# SRT is complete the moment the last samples are emitted.
 # -------------------------
-audio_parts = []
-subtitles = []
-current_time = 0.0
-last_spoken = None
-subtitle_index = 1
-
-for text, pause in segments:
-    normalized = normalize_text(text).lower()
-    if normalized == last_spoken:
-        continue
-
-    last_spoken = normalized
-    wav = tts.tts(text=text, speaker=speaker)
-    duration = len(wav) / sr
-
-    start = current_time
-    end = start + duration
-
-    subtitles.append(
-        f"{subtitle_index}\n"
-        f"{format_timestamp(start)} --> {format_timestamp(end)}\n"
-        f"{text}\n"
-    )
-
-    subtitle_index += 1
-    current_time = end
-    audio_parts.append(wav)
+def synthesize(tts, segments, subtitle_filename: str, emit, progress=None):
+    sr = tts.synthesizer.output_sample_rate
+
+    current_time = 0.0
+    last_spoken = None
+    subtitle_index = 1
+
+    with profiling.torch_ops("synthesis") as step, \
+            open(subtitle_filename, "w", encoding="utf-8") as subtitle_out:
+        for position, (text, pause) in enumerate(segments):
+            normalized = normalize_text(text).lower()
+            if normalized == last_spoken:
+                continue
+
+            last_spoken = normalized
+            wav = frontend.speak(tts, text, SPEAKER)
+            duration = len(wav) / sr
+
+            start = current_time
+            end = start + duration
+
+            if subtitle_index > 1:
+                subtitle_out.write("\n")
+            subtitle_out.write(
+                f"{subtitle_index}\n"
+                f"{format_timestamp(start)} --> {format_timestamp(end)}\n"
+                f"{text}\n"
+            )
+            subtitle_out.flush()
+
+            subtitle_index += 1
+            current_time = end
+            emit(wav)
+
+            if pause > 0:
+                emit(silence(pause, sr))
+                current_time += pause
+
+            if progress:
+                progress("audio", (position + 1) / len(segments))
+            step()
+
+    frontend.report(tts)
 
-    if pause > 0:
-        audio_parts.append(silence(pause, sr))
-        current_time += pause
+# -------------------------
+# Background pre-render
+# video.py encodes the looped clip + music bed while we synthesize;
+# the video stage then only mixes, burns cues and trims.
+# -------------------------
+def predict_duration(segments) -> float:
+    chars = sum(len(text) for text, pause in segments)
+    pauses = sum(pause for text, pause in segments)
+    return chars / PREDICT_CHARS_PER_SECOND + pauses + PREDICT_MARGIN_SECONDS
+
+def prerender_threads() -> int:
+    # Never more than the lease's encoder share, when there is one
+    leased = os.getenv("ENCODER_THREADS")
+    return min(PRERENDER_THREADS, int(leased)) if leased else PRERENDER_THREADS
+
+def start_prerender(audio_filename: str, duration: float):
+    logger.info("Pre-rendering %.0fs of background while synthesizing", duration)
+    return subprocess.Popen(
+        profiling.profiled_cmd("prerender-encoder", [
+            "python", VIDEO_SCRIPT, audio_filename,
+            "--prerender", f"{duration:.1f}",
+        ]),
+        stdout=subprocess.PIPE,
+        env={**os.environ, "ENCODER_THREADS": str(prerender_threads())},
+    )
 
-final_audio = np.concatenate(audio_parts)
+def finish_prerender(
+    work_dir: str,
+    manifest: dict,
+    prerender,
+    duration: float,
+    audio_filename: str,
+    narration_seconds: float,
+):
+    prerender_out = prerender.stdout.read().decode("utf-8")
+    returncode = prerender.wait()
+
+    # video.py recorded the episode assets meanwhile
+    manifest.update(load_manifest(work_dir))
+
+    # A failed pre-render only costs the overlap; video.py renders normally
+    if returncode != 0:
+        logger.warning("Background pre-render failed, video stage will render it")
+        return
+
+    if narration_seconds > duration:
+        logger.warning(
+            "Narration (%.1fs) outran the pre-rendered background (%.1fs), video stage will render it",
+            narration_seconds, duration
+        )
+        return
+
+    # Keyed on the WAV it was cut for: a re-synthesized narration
+    # invalidates it and the video stage renders from scratch
+    record_stage(
+        work_dir, manifest, "background",
+        {"audio": hash_file(audio_filename)},
+        {"background": prerender_out.strip().splitlines()[-1]},
+        {"duration": duration},
+    )
 
 # -------------------------
-# Save outputs (TEMP)
+# Narrate one episode
+# tts: an already loaded model (warm workers); loaded on demand otherwise
+# stream: pipe PCM straight into video.py while synthesizing (no WAV)
+# prerender: encode the background in parallel from a predicted length
 # -------------------------
-base_filename = sanitize_filename(clean_experience["title"])
+def narrate(
+    experience_url: str | None = None,
+    tts=None,
+    stream: bool = False,
+    progress=None,
+    prerender: bool = False,
+    soft_subs: bool = False,
+) -> dict:
+    if not experience_url:
+        experience_url = fetch_random_experience_url()
+
+    # -------------------------
+    # Episode work dir
+    # -------------------------
+    work_dir = episode_dir(experience_url)
+    manifest = load_manifest(work_dir)
+    manifest["experience_url"] = experience_url
+    logger.info("Episode work dir: %s (%s)", work_dir, experience_url)
+
+    data = fetch_experience(work_dir, manifest, experience_url)
+
+    clean_experience = {
+        "title": data["title"],
+        "username": data["author"],
+        "gender": data["metadata"].get("gender", "Unknown"),
+        "age": data["metadata"].get("age", "Unknown"),
+        "content": data["content"],
+        "doses": data.get("doses", []),
+    }
 
-audio_filename = os.path.join(TEMP_DIR, f"{base_filename}.wav")
-subtitle_filename = os.path.join(TEMP_DIR, f"{base_filename}.srt")
+    # -------------------------
+    # Detect primary substance
+    # -------------------------
+    primary_substance = detect_primary_substance(
+        clean_experience["content"],
+        clean_experience["doses"]
+    )
 
-sf.write(audio_filename, final_audio, sr)
+    tts_script = build_script(clean_experience, primary_substance)
 
-with open(subtitle_filename, "w", encoding="utf-8") as f:
-    f.write("\n".join(subtitles))
+    script_file = os.path.join(work_dir, "script.txt")
+    script_inputs = {"experience": hash_file(os.path.join(work_dir, "experience.json"))}
 
-# -------------------------
-# Frontend experience link
-# -------------------------
-encoded_url = quote(experience_url, safe="")
-frontend_link = (
-    f"{LYSERGIC_FRONTEND}/experience/view?url={encoded_url}"
-)
+    if not stage_valid(manifest, "script", script_inputs):
+        with open(script_file, "w", encoding="utf-8") as f:
+            f.write(tts_script)
+
+        record_stage(
+            work_dir, manifest, "script",
+            script_inputs,
+            {"script": script_file},
+            {"primary_substance": primary_substance},
+        )
+
+    segments = split_with_punctuation(normalize_text(tts_script))
+
+    # -------------------------
+    # Output paths (episode work dir)
+    # -------------------------
+    base_filename = sanitize_filename(clean_experience["title"])
+
+    audio_filename = os.path.join(work_dir, f"{base_filename}.wav")
+    subtitle_filename = os.path.join(work_dir, f"{base_filename}.srt")
+
+    audio_inputs = {
+        "script": hash_file(script_file),
+        "model": MODEL_NAME,
+        "speaker": SPEAKER,
+    }
+
+    # Streaming renders the video directly, so it checkpoints as the video stage
+    stream_inputs = {**audio_inputs, "mode": "stream"}
+    if soft_subs:
+        stream_inputs["subtitles"] = "soft"
+    video_filename = None
+
+    if stage_valid(manifest, "audio", audio_inputs):
+        pass
+    elif stream and stage_valid(manifest, "video", stream_inputs):
+        video_filename = stage_entry(manifest, "video")["outputs"]["video"]
+    else:
+        tts = tts or load_tts()
+        sr = tts.synthesizer.output_sample_rate
+
+        if stream:
+            # -------------------------
+            # Stream mode: encoder reads our PCM on its stdin
+            # -------------------------
+            logger.info("Streaming narration into %s", VIDEO_SCRIPT)
+            encoder_cmd = [
+                "python", VIDEO_SCRIPT, audio_filename,
+                "--stream",
+                "--sample-rate", str(sr),
+            ]
+            if soft_subs:
+                encoder_cmd.append("--soft-subs")
+
+            encoder = subprocess.Popen(
+                profiling.profiled_cmd("stream-encoder", encoder_cmd),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+
+            def emit(samples):
+                encoder.stdin.write(samples.tobytes())
+
+            try:
+                synthesize(tts, segments, subtitle_filename, emit, progress)
+            except BrokenPipeError:
+                encoder.kill()
+                raise RuntimeError(f"{VIDEO_SCRIPT} exited while streaming")
+
+            encoder.stdin.close()
+            encoder_out = encoder.stdout.read().decode("utf-8")
+
+            if encoder.wait() != 0:
+                raise RuntimeError(f"{VIDEO_SCRIPT} failed!")
+
+            # video.py recorded the episode assets meanwhile
+            manifest.update(load_manifest(work_dir))
+
+            video_filename = encoder_out.strip().splitlines()[-1]
+            record_stage(
+                work_dir, manifest, "video",
+                stream_inputs,
+                {"video": video_filename, "srt": subtitle_filename},
+            )
+        else:
+            prerender_job = None
+            if prerender:
+                predicted = predict_duration(segments)
+                prerender_job = start_prerender(audio_filename, predicted)
+
+            audio_parts = []
+            try:
+                synthesize(tts, segments, subtitle_filename, audio_parts.append, progress)
+            except BaseException:
+                if prerender_job:
+                    prerender_job.kill()
+                raise
+
+            final_audio = np.concatenate(audio_parts)
+            sf.write(audio_filename, final_audio, sr)
+
+            # Before the audio stage is recorded, so its manifest write
+            # keeps what video.py --prerender added
+            if prerender_job:
+                narration_seconds = len(final_audio) / sr
+                logger.info(
+                    "Narration %.1fs, predicted bound %.1fs",
+                    narration_seconds, predicted
+                )
+                finish_prerender(
+                    work_dir, manifest, prerender_job, predicted,
+                    audio_filename, narration_seconds
+                )
+
+            record_stage(
+                work_dir, manifest, "audio",
+                audio_inputs,
+                {"wav": audio_filename, "srt": subtitle_filename},
+            )
+
+    # -------------------------
+    # Frontend experience link
+    # -------------------------
+    encoded_url = quote(experience_url, safe="")
+    frontend_link = (
+        f"{LYSERGIC_FRONTEND}/experience/view?url={encoded_url}"
+    )
+
+    return {
+        "audio_file": audio_filename,
+        "subtitle_file": subtitle_filename,
+        "primary_substance": primary_substance,
+        "experience_url": frontend_link,
+        "video_file": video_filename,
+    }
 
 # -------------------------
 # Output for pipeline
+# A fifth field means the video was already rendered (stream mode)
 # -------------------------
-print(
-    f"{audio_filename}|{subtitle_filename}|"
-    f"{primary_substance}|{frontend_link}"
-)
+def format_output(result: dict) -> str:
+    output_line = (
+        f"{result['audio_file']}|{result['subtitle_file']}|"
+        f"{result['primary_substance']}|{result['experience_url']}"
+    )
+    if result.get("video_file"):
+        output_line += f"|{result['video_file']}"
+    return output_line
+
+
+if __name__ == "__main__":
+    # -------------------------
+    # Parse args
+    # -------------------------
+    parser = argparse.ArgumentParser(description="Narrate an Erowid experience")
+    parser.add_argument("experience_url", nargs="?", help="URL of the experience")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Pipe PCM straight into video.py while synthesizing (no WAV)"
+    )
+    parser.add_argument(
+        "--prerender",
+        action="store_true",
+        help="Encode background + music from a predicted length while synthesizing"
+    )
+    parser.add_argument(
+        "--soft-subs",
+        action="store_true",
+        help="Stream mode: mux subtitles as a track instead of burning them in"
+    )
+    args = parser.parse_args()
+
+    experience_url = None
+    if args.experience_url:
+        experience_url = unquote(args.experience_url)
+        logger.info("Using provided experience URL: %s", experience_url)
+
+    try:
+        result = narrate(
+            experience_url,
+            stream=args.stream,
+            prerender=args.prerender and not args.stream,
+            soft_subs=args.soft_subs,
+        )
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+
+    print(format_output(result))
@@ -8,11 +8,27 @@ import re
 import logging
 import string
 import sys
-from urllib.parse import unquote
+import json
+import queue
+import argparse
+import threading
+from urllib.parse import unquote, quote
 from collections import Counter
 
 from google import genai
 
+import frontend
+import profiling
+from episode import (
+    episode_dir,
+    load_manifest,
+    stage_valid,
+    record_stage,
+    stage_entry,
+    hash_file,
+    hash_text,
+)
+
 # -------------------------
 # Logging setup
 # -------------------------
@@ -30,10 +46,25 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     raise RuntimeError("GOOGLE_API_KEY environment variable not set")
 
+LYSERGIC_FRONTEND = os.getenv(
+    "LYSERGIC_FRONTEND",
+    "https://lysergic.vercel.app"
+)
+LYSERGIC_API = os.getenv("LYSERGIC_API", "https://lysergic.kaizenklass.xyz")
+
+# Points the client at a local stand-in (see loadtest.py)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+MODEL_NAME = "tts_models/en/vctk/vits"
+SPEAKER = "p232"
+
 # -------------------------
 # Create Gemini client
 # -------------------------
-client = genai.Client(api_key=GOOGLE_API_KEY)
+client = genai.Client(
+    api_key=GOOGLE_API_KEY,
+    http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None,
+)
 
 # -------------------------
 # Helpers
@@ -109,7 +140,6 @@ def clean_and_extract(content: str):
 
     text_out = response.text.strip()
 
-    import json
     try:
         parsed = json.loads(text_out)
         return (
@@ -127,80 +157,71 @@ def clean_and_extract(content: str):
         return content, fallback_primary
 
 # -------------------------
-# Parse experience URL
+# Gemini cleanup, streamed
+# Line-delimited output so complete sentences can be handed to TTS
+# while the rest of the response is still generating.
 # -------------------------
-experience_url = None
-if len(sys.argv) > 1:
-    experience_url = unquote(sys.argv[1])
-    logger.info("Using provided experience URL: %s", experience_url)
+STREAM_PREFIX = "PRIMARY_SUBSTANCE:"
 
-# -------------------------
-# Fetch random if none
-# -------------------------
-if not experience_url:
-    logger.info("Fetching random Erowid experience")
-    url = "https://lysergic.kaizenklass.xyz/api/v1/erowid/random/experience?size_per_substance=1"
-    substances = {
-        "urls": [
-            "https://www.erowid.org/chemicals/dmt/dmt.shtml",
-            "https://www.erowid.org/chemicals/lsd/lsd.shtml",
-            "https://www.erowid.org/plants/salvia/salvia.shtml",
-            "https://www.erowid.org/plants/cannabis/cannabis.shtml",
-            "https://www.erowid.org/chemicals/mdma/mdma.shtml",
-            "https://www.erowid.org/chemicals/heroin/heroin.shtml",
-            "https://www.erowid.org/chemicals/cocaine/cocaine.shtml",
-            "https://www.erowid.org/chemicals/ketamine/ketamine.shtml",
-        ]
-    }
-    experience = requests.post(url, json=substances).json()
-    experience_url = experience["experience"]["url"]
+def stream_clean(content: str):
+    prompt = (
+        "Clean up the following experience content by fixing punctuation "
+        "and removing repeated sentences. Reply in plain text, no JSON or "
+        "markdown. The first line must be:\n"
+        f"{STREAM_PREFIX} <substance>\n"
+        "Then write the cleaned content with exactly one sentence per line.\n\n"
+        f"Content:\n{content}"
+    )
 
-# -------------------------
-# Fetch experience details
-# -------------------------
-logger.info("Fetching full experience details")
-resp = requests.post(
-    "https://lysergic.kaizenklass.xyz/api/v1/erowid/experience",
-    json={"url": experience_url},
-)
-data = resp.json().get("data", {})
+    response = client.models.generate_content_stream(
+        model="gemini-2.5-flash",
+        contents=prompt
+    )
 
-raw_content = data.get("content", "")
+    buffer = ""
+    for chunk in response:
+        buffer += chunk.text or ""
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield from parse_stream_line(line)
 
-# -------------------------
-# Clean + extract primary substance
-# -------------------------
-cleaned_content, gemini_primary = clean_and_extract(raw_content)
+    yield from parse_stream_line(buffer)
 
-# -------------------------
-# Determine final primary substance
-# -------------------------
-primary_substance = detect_primary_substance_by_frequency(cleaned_content)
+def parse_stream_line(line: str):
+    line = line.strip()
+    if not line:
+        return
 
-if not primary_substance:
-    primary_substance = gemini_primary
+    if line.upper().startswith(STREAM_PREFIX):
+        yield "substance", line[len(STREAM_PREFIX):].strip()
+    else:
+        yield "sentence", line
 
-if not primary_substance or primary_substance == "Unknown":
-    match = re.search(
-        r'\b(LSD|DMT|Salvia|MDMA|Cannabis|Heroin)\b',
-        cleaned_content,
-        re.IGNORECASE
-    )
-    primary_substance = match.group(0) if match else "Unknown"
+# -------------------------
+# Fetch random experience
+# -------------------------
+SUBSTANCE_PAGES = [
+    "https://www.erowid.org/chemicals/dmt/dmt.shtml",
+    "https://www.erowid.org/chemicals/lsd/lsd.shtml",
+    "https://www.erowid.org/plants/salvia/salvia.shtml",
+    "https://www.erowid.org/plants/cannabis/cannabis.shtml",
+    "https://www.erowid.org/chemicals/mdma/mdma.shtml",
+    "https://www.erowid.org/chemicals/heroin/heroin.shtml",
+    "https://www.erowid.org/chemicals/cocaine/cocaine.shtml",
+    "https://www.erowid.org/chemicals/ketamine/ketamine.shtml",
+]
 
-logger.info("Final primary substance: %s", primary_substance)
+def fetch_random_experience_url() -> str:
+    logger.info("Fetching random Erowid experience")
+    url = f"{LYSERGIC_API}/api/v1/erowid/random/experience?size_per_substance=1"
+    experience = requests.post(url, json={"urls": SUBSTANCE_PAGES}).json()
+    return experience["experience"]["url"]
 
 # -------------------------
 # Build TTS text
 # -------------------------
-clean_experience = {
-    "title": data.get("title", "Unknown Title"),
-    "username": data.get("author", "Unknown"),
-    "gender": data.get("metadata", {}).get("gender", "Unknown"),
-    "age": data.get("metadata", {}).get("age", "Unknown"),
-}
-
-tts_script = f"""
+def build_intro(clean_experience: dict, primary_substance: str) -> str:
+    return f"""
 Welcome.
 
 This is a narrated experience report from Erowid.org.
@@ -212,43 +233,378 @@ This is a narrated experience report from Erowid.org.
 Submitted by {clean_experience['username']}.
 Age: {clean_experience['age']}.
 Gender: {clean_experience['gender']}.
+"""
 
-{cleaned_content}
+OUTRO = "Thank you for listening."
 
-Thank you for listening.
-"""
+def build_script(clean_experience: dict, primary_substance: str, cleaned_content: str) -> str:
+    return (
+        build_intro(clean_experience, primary_substance)
+        + f"\n{cleaned_content}\n\n{OUTRO}\n"
+    )
+
+def load_tts():
+    if os.getenv("TTS_STUB"):
+        from loadtest import StubTTS
+        return StubTTS()
+
+    logger.info("Loading TTS model")
+    return TTS(
+        model_name=MODEL_NAME,
+        progress_bar=False,
+        gpu=False
+    )
 
 # -------------------------
 # Generate audio
+# Returns the last spoken segment so consecutive calls keep deduplicating
 # -------------------------
-logger.info("Loading TTS model")
-tts = TTS(
-    model_name="tts_models/en/vctk/vits",
-    progress_bar=False,
-    gpu=False
-)
-sr = tts.synthesizer.output_sample_rate
+def synthesize_segments(tts, segments, audio_parts: list, last_spoken=None, step=None):
+    sr = tts.synthesizer.output_sample_rate
+
+    for text, pause in segments:
+        normalized = normalize_text(text).lower()
+        if normalized == last_spoken:
+            logger.warning("Skipping duplicate segment: %s", text[:60])
+            continue
+        last_spoken = normalized
+
+        logger.info("Synthesizing: %s...", text[:40])
+        wav = frontend.speak(tts, text, SPEAKER)
+        audio_parts.append(wav)
+        audio_parts.append(silence(pause, sr))
+        if step:
+            step()
+
+    return last_spoken
+
+def final_primary_substance(text: str, gemini_primary: str | None) -> str:
+    primary_substance = detect_primary_substance_by_frequency(text)
+
+    if not primary_substance:
+        primary_substance = gemini_primary
+
+    if not primary_substance or primary_substance == "Unknown":
+        match = re.search(
+            r'\b(LSD|DMT|Salvia|MDMA|Cannabis|Heroin)\b',
+            text,
+            re.IGNORECASE
+        )
+        primary_substance = match.group(0) if match else "Unknown"
+
+    return primary_substance
+
+# -------------------------
+# Streaming Gemini -> TTS
+# The model loads while the first tokens arrive; the intro is spoken
+# as soon as the model is ready, then each cleaned sentence as it lands.
+# -------------------------
+def narrate_streaming(clean_experience: dict, raw_content: str, tts=None, progress=None, step=None):
+    loaded = {"tts": tts}
+    loader = None
+    if not tts:
+        loader = threading.Thread(target=lambda: loaded.update(tts=load_tts()))
+        loader.start()
+
+    sentences = queue.Queue()
+
+    def produce():
+        try:
+            for item in stream_clean(raw_content):
+                sentences.put(item)
+        except Exception as e:
+            sentences.put(("error", e))
+        finally:
+            sentences.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    def next_item():
+        item = sentences.get()
+        if item and item[0] == "error":
+            raise RuntimeError(f"Gemini stream failed: {item[1]}")
+        return item
+
+    # The intro needs the substance before any cleaned text exists: guess
+    # it from the raw report, or wait for Gemini's header line. The final
+    # pick is made from the cleaned text, as in the non-stream path.
+    gemini_primary = None
+    pending = []
+    primary_substance = detect_primary_substance_by_frequency(raw_content)
+
+    while not primary_substance:
+        item = next_item()
+        if item is None:
+            break
+        if item[0] == "substance":
+            gemini_primary = item[1]
+            break
+        pending.append(item)
+
+    primary_substance = final_primary_substance(raw_content, gemini_primary)
+    logger.info("Provisional primary substance: %s", primary_substance)
+
+    if loader:
+        loader.join()
+    tts = loaded["tts"]
+
+    audio_parts = []
+    intro = build_intro(clean_experience, primary_substance)
+    last_spoken = synthesize_segments(
+        tts, split_with_punctuation(normalize_text(intro)), audio_parts, step=step
+    )
+    intro_parts = len(audio_parts)
+
+    cleaned_lines = []
+    spoken_chars = 0
+
+    while True:
+        item = pending.pop(0) if pending else next_item()
+        if item is None:
+            break
+
+        kind, value = item
+        if kind == "substance":
+            gemini_primary = value
+            continue
+
+        cleaned_lines.append(value)
+        last_spoken = synthesize_segments(
+            tts, split_with_punctuation(normalize_text(value)), audio_parts, last_spoken, step
+        )
+
+        spoken_chars += len(value)
+        if progress:
+            progress("audio", min(0.99, spoken_chars / max(1, len(raw_content))))
+
+    synthesize_segments(
+        tts, split_with_punctuation(OUTRO), audio_parts, last_spoken, step
+    )
+
+    cleaned_content = " ".join(cleaned_lines)
+    gemini_primary = gemini_primary or "Unknown"
+
+    final_substance = final_primary_substance(cleaned_content, gemini_primary)
+    logger.info("Final primary substance: %s", final_substance)
+
+    # Cleanup can shift the counts; respeak the intro so the audio matches
+    # the script a non-stream rerun would build from cleaned.txt
+    if final_substance != primary_substance:
+        logger.info("Substance changed after cleanup, respeaking the intro")
+        intro = build_intro(clean_experience, final_substance)
+        intro_audio = []
+        synthesize_segments(
+            tts, split_with_punctuation(normalize_text(intro)), intro_audio, step=step
+        )
+        audio_parts[:intro_parts] = intro_audio
+
+    return cleaned_content, gemini_primary, final_substance, audio_parts, tts
+
+# -------------------------
+# Narrate one episode
+# tts: an already loaded model (warm workers); loaded on demand otherwise
+# stream: stream the Gemini response straight into synthesis
+# -------------------------
+def narrate(
+    experience_url: str | None = None,
+    tts=None,
+    progress=None,
+    stream: bool = False,
+) -> dict:
+    if not experience_url:
+        experience_url = fetch_random_experience_url()
+
+    # -------------------------
+    # Episode work dir
+    # -------------------------
+    work_dir = episode_dir(experience_url)
+    manifest = load_manifest(work_dir)
+    manifest["experience_url"] = experience_url
+    logger.info("Episode work dir: %s (%s)", work_dir, experience_url)
+
+    # -------------------------
+    # Fetch experience details
+    # -------------------------
+    experience_file = os.path.join(work_dir, "experience.json")
+    experience_inputs = {"url": experience_url}
+
+    if stage_valid(manifest, "experience", experience_inputs):
+        with open(experience_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        logger.info("Fetching full experience details")
+        resp = requests.post(
+            f"{LYSERGIC_API}/api/v1/erowid/experience",
+            json={"url": experience_url},
+        )
+        data = resp.json().get("data", {})
+
+        with open(experience_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+        record_stage(
+            work_dir, manifest, "experience",
+            experience_inputs,
+            {"experience": experience_file},
+        )
+
+    raw_content = data.get("content", "")
+
+    clean_experience = {
+        "title": data.get("title", "Unknown Title"),
+        "username": data.get("author", "Unknown"),
+        "gender": data.get("metadata", {}).get("gender", "Unknown"),
+        "age": data.get("metadata", {}).get("age", "Unknown"),
+    }
 
-segments = split_with_punctuation(normalize_text(tts_script))
-audio_parts = []
-last_spoken = None  # deduplication logic
+    audio_filename = os.path.join(
+        work_dir,
+        sanitize_filename(clean_experience["title"]) + ".wav"
+    )
+    subtitle_filename = os.path.splitext(audio_filename)[0] + ".srt"
+
+    encoded_url = quote(experience_url, safe="")
+    frontend_link = f"{LYSERGIC_FRONTEND}/experience/view?url={encoded_url}"
+
+    result = {
+        "audio_file": audio_filename,
+        "subtitle_file": subtitle_filename,
+        "primary_substance": None,
+        "experience_url": frontend_link,
+        "video_file": None,
+    }
+
+    # -------------------------
+    # Clean + extract primary substance
+    # -------------------------
+    cleaned_file = os.path.join(work_dir, "cleaned.txt")
+    cleaned_inputs = {"experience": hash_file(experience_file)}
+
+    if stream and not stage_valid(manifest, "cleaned", cleaned_inputs):
+        # Also loads the model, so a few load-time ops land in the table
+        with profiling.torch_ops("streaming synthesis") as step:
+            cleaned_content, gemini_primary, primary_substance, audio_parts, tts = (
+                narrate_streaming(clean_experience, raw_content, tts, progress, step)
+            )
+
+        with open(cleaned_file, "w", encoding="utf-8") as f:
+            f.write(cleaned_content)
+
+        record_stage(
+            work_dir, manifest, "cleaned",
+            cleaned_inputs,
+            {"cleaned": cleaned_file},
+            {"primary_substance": gemini_primary},
+        )
+
+        sr = tts.synthesizer.output_sample_rate
+        frontend.report(tts)
+        sf.write(audio_filename, np.concatenate(audio_parts), sr)
+        logger.info("Saved audio as %s", audio_filename)
+
+        tts_script = build_script(clean_experience, primary_substance, cleaned_content)
+        record_stage(
+            work_dir, manifest, "audio",
+            {
+                "script": hash_text(tts_script),
+                "model": MODEL_NAME,
+                "speaker": SPEAKER,
+            },
+            {"wav": audio_filename},
+        )
+
+        result["primary_substance"] = primary_substance
+        return result
+
+    if stage_valid(manifest, "cleaned", cleaned_inputs):
+        with open(cleaned_file, "r", encoding="utf-8") as f:
+            cleaned_content = f.read()
+        gemini_primary = stage_entry(manifest, "cleaned")["data"]["primary_substance"]
+    else:
+        cleaned_content, gemini_primary = clean_and_extract(raw_content)
+
+        with open(cleaned_file, "w", encoding="utf-8") as f:
+            f.write(cleaned_content)
+
+        record_stage(
+            work_dir, manifest, "cleaned",
+            cleaned_inputs,
+            {"cleaned": cleaned_file},
+            {"primary_substance": gemini_primary},
+        )
 
-for text, pause in segments:
-    normalized = normalize_text(text).lower()
-    if normalized == last_spoken:
-        logger.warning("Skipping duplicate segment: %s", text[:60])
-        continue
-    last_spoken = normalized
+    # -------------------------
+    # Determine final primary substance
+    # -------------------------
+    primary_substance = final_primary_substance(cleaned_content, gemini_primary)
+    logger.info("Final primary substance: %s", primary_substance)
+
+    tts_script = build_script(clean_experience, primary_substance, cleaned_content)
+
+    # -------------------------
+    # Generate audio
+    # -------------------------
+    audio_inputs = {
+        "script": hash_text(tts_script),
+        "model": MODEL_NAME,
+        "speaker": SPEAKER,
+    }
+
+    if not stage_valid(manifest, "audio", audio_inputs):
+        tts = tts or load_tts()
+        sr = tts.synthesizer.output_sample_rate
+
+        segments = split_with_punctuation(normalize_text(tts_script))
+        audio_parts = []
+        last_spoken = None  # deduplication logic
+
+        with profiling.torch_ops("synthesis") as step:
+            for position, segment in enumerate(segments):
+                if progress:
+                    progress("audio", position / len(segments))
+                last_spoken = synthesize_segments(tts, [segment], audio_parts, last_spoken, step)
 
-    logger.info("Synthesizing: %s...", text[:40])
-    wav = tts.tts(text=text, speaker="p232")
-    audio_parts.append(wav)
-    audio_parts.append(silence(pause, sr))
+        frontend.report(tts)
+        final_audio = np.concatenate(audio_parts)
 
-final_audio = np.concatenate(audio_parts)
+        sf.write(audio_filename, final_audio, sr)
+        logger.info("Saved audio as %s", audio_filename)
 
-audio_filename = sanitize_filename(clean_experience["title"]) + ".wav"
-sf.write(audio_filename, final_audio, sr)
-logger.info("Saved audio as %s", audio_filename)
+        record_stage(
+            work_dir, manifest, "audio",
+            audio_inputs,
+            {"wav": audio_filename},
+        )
+
+    result["primary_substance"] = primary_substance
+    return result
 
-print(f"{audio_filename}|{primary_substance}")
+
+if __name__ == "__main__":
+    # -------------------------
+    # Parse args
+    # -------------------------
+    parser = argparse.ArgumentParser(description="Narrate an Erowid experience (Gemini cleanup)")
+    parser.add_argument("experience_url", nargs="?", help="URL of the experience")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Synthesize cleaned sentences while Gemini is still responding"
+    )
+    args = parser.parse_args()
+
+    experience_url = None
+    if args.experience_url:
+        experience_url = unquote(args.experience_url)
+        logger.info("Using provided experience URL: %s", experience_url)
+
+    try:
+        result = narrate(experience_url, stream=args.stream)
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+
+    print(
+        f"{result['audio_file']}|{result['subtitle_file']}|"
+        f"{result['primary_substance']}|{result['experience_url']}"
+    )
@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+from episode import (
+    WORK_DIR,
+    episode_dir,
+    load_manifest,
+    stage_valid,
+    record_stage,
+    hash_text,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+CATALOG_DB = os.getenv("CATALOG_DB", os.path.join(WORK_DIR, "catalog.db"))
+LYSERGIC_API = os.getenv("LYSERGIC_API", "https://lysergic.kaizenklass.xyz")
+
+# A claim that never finished (crashed run) frees up after this
+CLAIM_TTL = 6 * 3600
+
+# Random API reports tried before giving up on finding a fresh one
+RANDOM_ATTEMPTS = 5
+
+SUBSTANCE_PAGES = {
+    "DMT": "https://www.erowid.org/chemicals/dmt/dmt.shtml",
+    "LSD": "https://www.erowid.org/chemicals/lsd/lsd.shtml",
+    "Salvia": "https://www.erowid.org/plants/salvia/salvia.shtml",
+    "Cannabis": "https://www.erowid.org/plants/cannabis/cannabis.shtml",
+    "MDMA": "https://www.erowid.org/chemicals/mdma/mdma.shtml",
+    "Heroin": "https://www.erowid.org/chemicals/heroin/heroin.shtml",
+    "Cocaine": "https://www.erowid.org/chemicals/cocaine/cocaine.shtml",
+    "Ketamine": "https://www.erowid.org/chemicals/ketamine/ketamine.shtml",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiences (
+    url TEXT PRIMARY KEY,
+    substance TEXT,
+    title TEXT,
+    words INTEGER,
+    content_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'new',
+    youtube_id TEXT,
+    fetched_at REAL,
+    claimed_at REAL,
+    narrated_at REAL,
+    uploaded_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_experiences_status_substance
+    ON experiences (status, substance);
+CREATE INDEX IF NOT EXISTS idx_experiences_status_words
+    ON experiences (status, words);
+"""
+
+
+# -------------------------
+# Connection
+# -------------------------
+def connect(path: str = CATALOG_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # Lives on the shared WORK_DIR like queue.db: WAL needs shared memory,
+    # which network filesystems don't provide; the rollback journal only
+    # needs working file locks
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# -------------------------
+# Writes
+# -------------------------
+def upsert(conn, url: str, substance=None, title=None, words=None, content_hash=None):
+    conn.execute(
+        """
+        INSERT INTO experiences (url, substance, title, words, content_hash, fetched_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (url) DO UPDATE SET
+            substance = COALESCE(excluded.substance, substance),
+            title = COALESCE(excluded.title, title),
+            words = COALESCE(excluded.words, words),
+            content_hash = COALESCE(excluded.content_hash, content_hash),
+            fetched_at = COALESCE(excluded.fetched_at, fetched_at)
+        """,
+        (url, substance, title, words, content_hash,
+         time.time() if content_hash else None),
+    )
+
+
+def mark_narrated(url: str):
+    with closing(connect()) as conn:
+        upsert(conn, url)
+        conn.execute(
+            "UPDATE experiences SET status = 'narrated', narrated_at = ? "
+            "WHERE url = ? AND status != 'uploaded'",
+            (time.time(), url),
+        )
+
+
+def mark_uploaded(url: str, youtube_id: str):
+    with closing(connect()) as conn:
+        upsert(conn, url)
+        conn.execute(
+            "UPDATE experiences SET status = 'uploaded', youtube_id = ?, "
+            "uploaded_at = ? WHERE url = ?",
+            (youtube_id, time.time(), url),
+        )
+
+
+# -------------------------
+# Selection
+# Claims a random unnarrated report matching the filters
+# -------------------------
+def pick(substance: str | None = None, max_words: int | None = None) -> str | None:
+    query = (
+        "SELECT url FROM experiences "
+        "WHERE (status = 'new' OR (status = 'claimed' AND claimed_at < ?))"
+    )
+    params = [time.time() - CLAIM_TTL]
+
+    if substance:
+        query += " AND substance = ?"
+        params.append(substance)
+    if max_words:
+        query += " AND words <= ?"
+        params.append(max_words)
+
+    query += " ORDER BY random() LIMIT 1"
+
+    conn = connect()
+    try:
+        # IMMEDIATE takes the write lock up front so two pipelines
+        # never claim the same report
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(query, params).fetchone()
+
+        if row:
+            conn.execute(
+                "UPDATE experiences SET status = 'claimed', claimed_at = ? WHERE url = ?",
+                (time.time(), row["url"]),
+            )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    if row:
+        logger.info("Picked from catalog: %s", row["url"])
+        return row["url"]
+
+    return None
+
+
+def claim(url: str) -> bool:
+    # Claims a report found outside the catalog; False if it is already
+    # narrated, uploaded or claimed by a live run
+    now = time.time()
+
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        upsert(conn, url)
+        row = conn.execute(
+            "SELECT status, claimed_at FROM experiences WHERE url = ?", (url,)
+        ).fetchone()
+
+        free = row["status"] == "new" or (
+            row["status"] == "claimed" and row["claimed_at"] < now - CLAIM_TTL
+        )
+        if free:
+            conn.execute(
+                "UPDATE experiences SET status = 'claimed', claimed_at = ? WHERE url = ?",
+                (now, url),
+            )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    return free
+
+
+def pick_random(substance: str | None = None, max_words: int | None = None) -> str | None:
+    # Catalog first; the API random endpoint is the fallback, and what it
+    # returns goes through the same claim and the same filters
+    if substance and substance not in SUBSTANCE_PAGES:
+        raise ValueError(f"Unknown substance: {substance}")
+
+    url = pick(substance, max_words)
+    if url:
+        return url
+
+    logger.info("No catalog candidates, using a random report")
+    for _ in range(RANDOM_ATTEMPTS):
+        url = fetch_candidate(substance) if substance else fetch_random()
+
+        if max_words:
+            words = len(fetch_details(url).get("content", "").split())
+            with closing(connect()) as conn:
+                upsert(conn, url, substance=substance, words=words)
+            if words > max_words:
+                logger.info("Random report has %d words, fetching another: %s", words, url)
+                continue
+
+        if claim(url):
+            logger.info("Claimed random report: %s", url)
+            return url
+        logger.info("Random report already taken, fetching another: %s", url)
+
+    return None
+
+
+def stats() -> list:
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT substance, status, COUNT(*) AS count, AVG(words) AS avg_words "
+            "FROM experiences GROUP BY substance, status ORDER BY substance, status"
+        ).fetchall()
+
+
+# -------------------------
+# Prefetch
+# Details land in the episode work dir as a checkpointed experience
+# stage, so narrating a prefetched report skips the fetch.
+# -------------------------
+def fetch_candidate(substance: str) -> str:
+    url = f"{LYSERGIC_API}/api/v1/erowid/random/experience?size_per_substance=1"
+    experience = requests.post(
+        url, json={"urls": [SUBSTANCE_PAGES[substance]]}
+    ).json()
+    return experience["experience"]["url"]
+
+
+def fetch_random() -> str:
+    url = f"{LYSERGIC_API}/api/v1/erowid/random/experience?size_per_substance=1"
+    experience = requests.post(
+        url, json={"urls": list(SUBSTANCE_PAGES.values())}
+    ).json()
+    return experience["experience"]["url"]
+
+
+def fetch_details(experience_url: str) -> dict:
+    work_dir = episode_dir(experience_url)
+    manifest = load_manifest(work_dir)
+    manifest["experience_url"] = experience_url
+
+    experience_file = os.path.join(work_dir, "experience.json")
+    experience_inputs = {"url": experience_url}
+
+    if stage_valid(manifest, "experience", experience_inputs):
+        with open(experience_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    resp = requests.post(
+        f"{LYSERGIC_API}/api/v1/erowid/experience",
+        json={"url": experience_url}
+    )
+    data = resp.json()["data"]
+
+    with open(experience_file, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    record_stage(
+        work_dir, manifest, "experience",
+        experience_inputs,
+        {"experience": experience_file},
+    )
+    return data
+
+
+def prefetch(per_substance: int, substances=None, workers: int = 8) -> int:
+    substances = substances or list(SUBSTANCE_PAGES)
+    wanted = [s for s in substances for _ in range(per_substance)]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        candidates = list(pool.map(fetch_candidate, wanted))
+
+    with closing(connect()) as conn:
+        known = {
+            row["url"]
+            for row in conn.execute("SELECT url FROM experiences WHERE content_hash IS NOT NULL")
+        }
+
+    new = {}
+    for substance, url in zip(wanted, candidates):
+        if url not in known:
+            new[url] = substance
+
+    logger.info("Fetching details for %d new candidates", len(new))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        details = list(pool.map(fetch_details, new))
+
+    with closing(connect()) as conn:
+        for (url, substance), data in zip(new.items(), details):
+            content = data.get("content", "")
+            upsert(
+                conn, url,
+                substance=substance,
+                title=data.get("title"),
+                words=len(content.split()),
+                content_hash=hash_text(content),
+            )
+
+    return len(new)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Local experience catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prefetch_cmd = commands.add_parser("prefetch", help="Bulk-fetch candidate reports")
+    prefetch_cmd.add_argument("-n", "--per-substance", type=int, default=5)
+    prefetch_cmd.add_argument("-s", "--substance", action="append", choices=list(SUBSTANCE_PAGES))
+
+    pick_cmd = commands.add_parser("pick", help="Claim an unnarrated report")
+    pick_cmd.add_argument("-s", "--substance", choices=list(SUBSTANCE_PAGES))
+    pick_cmd.add_argument("-w", "--max-words", type=int)
+
+    commands.add_parser("stats", help="Counts by substance and status")
+
+    args = parser.parse_args()
+
+    if args.command == "prefetch":
+        added = prefetch(args.per_substance, args.substance)
+        logger.info("Added %d new reports", added)
+    elif args.command == "pick":
+        print(pick(args.substance, args.max_words) or "")
+    else:
+        for row in stats():
+            print(
+                f"{row['substance'] or '?':<10} {row['status']:<9} "
+                f"{row['count']:>5}  avg {int(row['avg_words'] or 0)} words"
+            )
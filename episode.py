@@ -0,0 +1,129 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# Entry points import this (through pipeline, catalog, ...) before their
+# own load_dotenv(), and WORK_DIR is read right here
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Paths
+# -------------------------
+WORK_DIR = os.getenv("WORK_DIR") or "work"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+
+# -------------------------
+# Hashing
+# -------------------------
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# -------------------------
+# Work directory
+# -------------------------
+def episode_id(experience_url: str) -> str:
+    return hashlib.sha1(experience_url.encode("utf-8")).hexdigest()[:12]
+
+
+def episode_dir(experience_url: str) -> str:
+    path = os.path.join(WORK_DIR, episode_id(experience_url))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# -------------------------
+# Episode lock
+# One run per work dir at a time: runs share manifest.json and the
+# narration files. flock also serializes threads of one process, since
+# each holder opens the lock file itself.
+# -------------------------
+@contextmanager
+def episode_lock(work_dir: str):
+    with open(os.path.join(work_dir, LOCK_FILE), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Waiting for another run of %s", work_dir)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+# -------------------------
+# Manifest
+# -------------------------
+def load_manifest(work_dir: str) -> dict:
+    path = os.path.join(work_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"stages": {}}
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(work_dir: str, manifest: dict):
+    path = os.path.join(work_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Atomic swap so a crash mid-write never leaves a truncated manifest
+    os.replace(tmp_path, path)
+
+
+def stage_valid(manifest: dict, stage: str, inputs: dict) -> bool:
+    entry = manifest["stages"].get(stage)
+    if not entry:
+        return False
+
+    if entry["inputs"] != inputs:
+        logger.info("Stage %s inputs changed, rerunning", stage)
+        return False
+
+    for name, path in entry["outputs"].items():
+        if not os.path.exists(path):
+            logger.info("Stage %s output missing (%s), rerunning", stage, name)
+            return False
+
+    logger.info("Stage %s is up to date, skipping", stage)
+    return True
+
+
+def record_stage(
+    work_dir: str,
+    manifest: dict,
+    stage: str,
+    inputs: dict,
+    outputs: dict,
+    data: dict | None = None,
+):
+    manifest["stages"][stage] = {
+        "inputs": inputs,
+        "outputs": outputs,
+        "data": data or {},
+        "completed_at": time.time(),
+    }
+    save_manifest(work_dir, manifest)
+
+
+def stage_entry(manifest: dict, stage: str) -> dict:
+    return manifest["stages"][stage]
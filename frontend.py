@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from episode import WORK_DIR, hash_text
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+FRONTEND_CACHE_FILE = os.getenv(
+    "FRONTEND_CACHE_FILE", os.path.join(WORK_DIR, "frontend_cache.json")
+)
+FRONTEND_CACHE_ENTRIES = int(os.getenv("FRONTEND_CACHE_ENTRIES", "50000"))
+FRONTEND_CACHE_BYTES = int(os.getenv("FRONTEND_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# OrderedDict slot + linked-list node per entry (measured on CPython 3.11);
+# the key str and the id array are sized with sys.getsizeof
+ENTRY_OVERHEAD = 96
+
+
+# -------------------------
+# Text front end
+# Coqui's cleaners + phonemizer + tokenizer, memoized per clause.
+# Ids are kept as int64 arrays; LRU bounded by entries and bytes;
+# persisted as JSON so the common words and phrases carry over between runs.
+# -------------------------
+class TextFrontend:
+    def __init__(
+        self,
+        tokenizer,
+        fingerprint: str,
+        path: str | None = FRONTEND_CACHE_FILE,
+        max_entries: int = FRONTEND_CACHE_ENTRIES,
+        max_bytes: int = FRONTEND_CACHE_BYTES,
+    ):
+        self.tokenizer = tokenizer
+        # Bound now: frontend_for() swaps the tokenizer's method for ours
+        self._tokenize = tokenizer.text_to_ids
+        self.fingerprint = fingerprint
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+        if path:
+            self.load()
+
+    @staticmethod
+    def _size(text: str, ids: array) -> int:
+        return sys.getsizeof(text) + sys.getsizeof(ids) + ENTRY_OVERHEAD
+
+    def _put(self, text: str, ids: array):
+        if text in self._entries:
+            self._bytes -= self._size(text, self._entries.pop(text))
+
+        self._entries[text] = ids
+        self._bytes += self._size(text, ids)
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            old_text, old_ids = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_text, old_ids)
+
+    def text_to_ids(self, text: str, language: str | None = None) -> array:
+        with self._lock:
+            ids = self._entries.get(text)
+            if ids is not None:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                return ids
+
+        started = time.perf_counter()
+        ids = array("q", self._tokenize(text, language=language))
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+            self._put(text, ids)
+
+        return ids
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            per_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "miss_seconds": self.miss_seconds,
+                "saved_seconds": self.hits * per_miss,
+            }
+
+    # -------------------------
+    # Persistence
+    # Other processes may have saved since we loaded: their entries are
+    # merged in (ours win) under a lock before the atomic swap.
+    # -------------------------
+    def _read(self) -> list:
+        if not os.path.exists(self.path):
+            return []
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable front-end cache %s: %s", self.path, e)
+            return []
+
+        if data.get("fingerprint") != self.fingerprint:
+            logger.info("Front-end cache is for another model config, starting fresh")
+            return []
+
+        return data["entries"]
+
+    def load(self):
+        with self._lock:
+            for text, ids in self._read():
+                self._put(text, array("q", ids))
+
+        logger.info("Front-end cache: %d entries from %s", len(self._entries), self.path)
+
+    def save(self):
+        if not self.path:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            with self._lock:
+                # Theirs go in as the oldest so ours are evicted last
+                for text, ids in reversed(self._read()):
+                    if text not in self._entries:
+                        ids = array("q", ids)
+                        self._entries[text] = ids
+                        self._entries.move_to_end(text, last=False)
+                        self._bytes += self._size(text, ids)
+                self._evict()
+
+                data = {
+                    "fingerprint": self.fingerprint,
+                    "entries": [
+                        (text, ids.tolist()) for text, ids in self._entries.items()
+                    ],
+                }
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+
+
+# -------------------------
+# Model glue
+# One front end per loaded model, installed on its tokenizer so
+# Synthesizer.tts() itself looks clauses up in the cache
+# -------------------------
+_frontends = {}
+
+
+def fingerprint(config) -> str:
+    # Anything that changes text -> ids invalidates the persisted cache
+    characters = config.get("characters")
+    if hasattr(characters, "to_dict"):
+        characters = characters.to_dict()
+
+    return hash_text(json.dumps(
+        {
+            "characters": characters,
+            "use_phonemes": config.get("use_phonemes"),
+            "phonemizer": config.get("phonemizer"),
+            "phoneme_language": config.get("phoneme_language"),
+            "text_cleaner": config.get("text_cleaner"),
+            "add_blank": config.get("add_blank"),
+            "enable_eos_bos_chars": config.get("enable_eos_bos_chars"),
+        },
+        sort_keys=True,
+        default=str,
+    ))
+
+
+def frontend_for(tts) -> TextFrontend | None:
+    model = getattr(tts.synthesizer, "tts_model", None)
+    if model is None or getattr(model, "tokenizer", None) is None:
+        # e.g. the load-test StubTTS
+        return None
+
+    key = id(tts)
+    if key not in _frontends:
+        frontend = TextFrontend(
+            model.tokenizer, fingerprint(tts.synthesizer.tts_config)
+        )
+        model.tokenizer.text_to_ids = frontend.text_to_ids
+        _frontends[key] = frontend
+    return _frontends[key]
+
+
+def speak(tts, text: str, speaker: str) -> np.ndarray:
+    # Plain tts.tts(): the cached front end sits under it
+    frontend_for(tts)
+    return np.asarray(tts.tts(text=text, speaker=speaker), dtype=np.float32)
+
+
+def report(tts):
+    # Logs the hit rate and persists the cache; call once per episode
+    frontend = frontend_for(tts)
+    if frontend is None:
+        return
+
+    stats = frontend.stats()
+    logger.info(
+        "Text front-end cache: %.1f%% hits (%d/%d), ~%.1fs of phonemization saved, %d entries",
+        stats["hit_rate"] * 100,
+        stats["hits"],
+        stats["hits"] + stats["misses"],
+        stats["saved_seconds"],
+        stats["entries"],
+    )
+    frontend.save()
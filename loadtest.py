@@ -0,0 +1,555 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+import psutil
+from flask import Flask, Response, jsonify, request, abort
+from werkzeug.serving import make_server
+
+from episode import episode_id, MANIFEST_FILE
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+FIXTURES_FILE = os.path.join("test", "fixtures", "reports.json")
+
+STUB_SAMPLE_RATE = 22050
+# Roughly the VITS speaking rate, so stub audio is as long as real audio
+STUB_SECONDS_PER_CHAR = 0.065
+
+GEMINI_CHUNK_CHARS = 120
+SAMPLE_INTERVAL = 0.25
+
+SUBSTANCES = ("LSD", "DMT", "Salvia", "MDMA", "Cannabis", "Ketamine", "Cocaine", "Heroin")
+
+
+# -------------------------
+# Stub synthesizer
+# Same surface audio.py / audio_gemini.py use from TTS.api.TTS;
+# enabled with TTS_STUB=1 (see load_tts)
+# -------------------------
+class StubTTS:
+    def __init__(self, sample_rate: int = STUB_SAMPLE_RATE):
+        self.synthesizer = SimpleNamespace(output_sample_rate=sample_rate)
+
+    def tts(self, text: str, speaker=None):
+        sr = self.synthesizer.output_sample_rate
+        t = np.arange(int(len(text) * STUB_SECONDS_PER_CHAR * sr)) / sr
+        return (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+# -------------------------
+# Fake services
+# One Flask app stands in for the Lysergic API, Gemini and YouTube.
+# Report URLs may carry a query (?run=...) so every episode gets its
+# own work dir and output file from the same fixtures.
+# -------------------------
+def load_fixtures(path: str = FIXTURES_FILE) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return {report["url"]: report for report in json.load(f)}
+
+
+def split_variant(url: str):
+    parts = urlsplit(url)
+    query = dict(
+        pair.split("=", 1) for pair in parts.query.split("&") if "=" in pair
+    )
+    run = query.pop("run", None)
+    base = parts._replace(
+        query="&".join(f"{k}={v}" for k, v in query.items())
+    ).geturl()
+    return base, run
+
+
+def gemini_response(text: str) -> dict:
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+        }]
+    }
+
+
+def youtube_discovery(root_url: str) -> dict:
+    # Just enough of the real document for videos.insert and
+    # playlistItems.insert; the media upload path is derived from rootUrl
+    def insert(resource: str, schema: str, media: bool = False) -> dict:
+        method = {
+            "id": f"youtube.{resource}.insert",
+            "path": f"youtube/v3/{resource}",
+            "httpMethod": "POST",
+            "parameters": {
+                "part": {
+                    "type": "string",
+                    "required": True,
+                    "repeated": True,
+                    "location": "query",
+                },
+            },
+            "parameterOrder": ["part"],
+            "request": {"$ref": schema},
+            "response": {"$ref": schema},
+        }
+        if media:
+            method["supportsMediaUpload"] = True
+            method["mediaUpload"] = {
+                "accept": ["video/*", "application/octet-stream"],
+                "maxSize": "256GB",
+                "protocols": {
+                    "simple": {"multipart": True, "path": "/upload/youtube/v3/videos"},
+                    "resumable": {"multipart": True, "path": "/resumable/upload/youtube/v3/videos"},
+                },
+            }
+        return method
+
+    return {
+        "kind": "discovery#restDescription",
+        "discoveryVersion": "v1",
+        "id": "youtube:v3",
+        "name": "youtube",
+        "version": "v3",
+        "rootUrl": root_url,
+        "servicePath": "",
+        "batchPath": "batch",
+        "parameters": {
+            "key": {"type": "string", "location": "query"},
+            "alt": {"type": "string", "location": "query", "default": "json"},
+        },
+        "resources": {
+            "videos": {"methods": {"insert": insert("videos", "Video", media=True)}},
+            "playlistItems": {"methods": {"insert": insert("playlistItems", "PlaylistItem")}},
+        },
+        "schemas": {
+            "Video": {"id": "Video", "type": "object"},
+            "PlaylistItem": {"id": "PlaylistItem", "type": "object"},
+        },
+    }
+
+
+def create_fake_services(reports: dict, latency: float = 0.0) -> Flask:
+    app = Flask("fake_services")
+
+    uploads = {}
+    counts = {"lysergic": 0, "gemini": 0, "youtube_uploads": 0, "youtube_bytes": 0}
+    lock = threading.Lock()
+    app.config["COUNTS"] = counts
+
+    def count(name: str, amount: int = 1):
+        with lock:
+            counts[name] += amount
+
+    # -------------------------
+    # Lysergic API
+    # -------------------------
+    @app.post("/api/v1/erowid/random/experience")
+    def random_experience():
+        count("lysergic")
+        time.sleep(latency)
+        url = random.choice(list(reports))
+        return jsonify({"experience": {"url": f"{url}&run={uuid.uuid4().hex[:8]}"}})
+
+    @app.post("/api/v1/erowid/experience")
+    def experience():
+        count("lysergic")
+        time.sleep(latency)
+
+        url = (request.get_json(silent=True) or {}).get("url", "")
+        base, run = split_variant(url)
+        if base not in reports:
+            abort(404)
+
+        data = dict(reports[base])
+        if run:
+            data["title"] = f"{data['title']} ({run})"
+        return jsonify({"data": data})
+
+    # -------------------------
+    # Gemini (generateContent / streamGenerateContent)
+    # Echoes the content back, one sentence per line when streaming
+    # -------------------------
+    @app.post("/v1beta/models/<path:action>")
+    def gemini(action):
+        count("gemini")
+        method = action.partition(":")[2]
+
+        body = request.get_json(silent=True) or {}
+        prompt = "".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        content = prompt.split("Content:\n", 1)[-1].strip()
+
+        match = re.search(r"\b(%s)\b" % "|".join(SUBSTANCES), content, re.IGNORECASE)
+        substance = match.group(0) if match else "Unknown"
+
+        if method == "generateContent":
+            time.sleep(latency)
+            text = json.dumps({"cleaned_content": content, "primary_substance": substance})
+            return jsonify(gemini_response(text))
+
+        if method == "streamGenerateContent":
+            sentences = re.split(r"(?<=[.!?])\s+", content)
+            text = f"PRIMARY_SUBSTANCE: {substance}\n" + "\n".join(sentences) + "\n"
+            chunks = [
+                text[i:i + GEMINI_CHUNK_CHARS]
+                for i in range(0, len(text), GEMINI_CHUNK_CHARS)
+            ]
+
+            def events():
+                for chunk in chunks:
+                    time.sleep(latency / len(chunks))
+                    yield f"data: {json.dumps(gemini_response(chunk))}\r\n\r\n"
+
+            return Response(events(), mimetype="text/event-stream")
+
+        abort(404)
+
+    # -------------------------
+    # YouTube
+    # Resumable upload: POST opens a session, PUTs carry the bytes,
+    # 308 until Content-Range says the upload is complete
+    # -------------------------
+    @app.get("/youtube/v3/discovery")
+    def discovery():
+        return jsonify(youtube_discovery(request.host_url))
+
+    @app.post("/upload/youtube/v3/videos")
+    def upload_start():
+        if request.args.get("uploadType") != "resumable":
+            abort(400)
+
+        upload_id = uuid.uuid4().hex
+        with lock:
+            uploads[upload_id] = 0
+
+        response = Response(status=200)
+        response.headers["Location"] = (
+            f"{request.host_url}upload/youtube/v3/videos"
+            f"?uploadType=resumable&upload_id={upload_id}"
+        )
+        return response
+
+    @app.put("/upload/youtube/v3/videos")
+    def upload_chunk():
+        upload_id = request.args.get("upload_id")
+        data = request.get_data()
+
+        with lock:
+            if upload_id not in uploads:
+                abort(404)
+            uploads[upload_id] += len(data)
+            received = uploads[upload_id]
+
+        count("youtube_bytes", len(data))
+
+        total = request.headers.get("Content-Range", "").rpartition("/")[2]
+        if total.isdigit() and received >= int(total):
+            time.sleep(latency)
+            count("youtube_uploads")
+            with lock:
+                del uploads[upload_id]
+            return jsonify({"kind": "youtube#video", "id": upload_id[:11]})
+
+        response = Response(status=308)
+        if received:
+            response.headers["Range"] = f"bytes=0-{received - 1}"
+        return response
+
+    @app.post("/youtube/v3/playlistItems")
+    def playlist_insert():
+        return jsonify({"kind": "youtube#playlistItem", "id": uuid.uuid4().hex[:16]})
+
+    return app
+
+
+def start_fake_services(reports: dict, latency: float = 0.0):
+    app = create_fake_services(reports, latency)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="fake-services", daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    logger.info("Fake services listening on %s", base_url)
+    return server, app, base_url
+
+
+def harness_env(base_url: str, work_dir: str, stub_tts: bool) -> dict:
+    env = os.environ.copy()
+    env.update({
+        "LYSERGIC_API": base_url,
+        "GEMINI_BASE_URL": base_url,
+        "GOOGLE_API_KEY": "loadtest",
+        "YOUTUBE_DISCOVERY_URL": f"{base_url}/youtube/v3/discovery",
+        "YT_PLAYLIST_ID": "loadtest",
+        # Everything the run writes stays in its own dir: renders, the
+        # catalog, and the scheduler's lease table, so a load test never
+        # holds leases that real pipeline runs on this host wait for
+        "WORK_DIR": work_dir,
+        "CATALOG_DB": os.path.join(work_dir, "catalog.db"),
+        "OUTPUT_DIR": os.path.join(work_dir, "output"),
+        "SCHEDULER_DB": os.path.join(work_dir, "scheduler.db"),
+    })
+
+    if stub_tts:
+        env["TTS_STUB"] = "1"
+    else:
+        env.pop("TTS_STUB", None)
+
+    return env
+
+
+# -------------------------
+# Peak memory
+# Sums RSS over every running main.py and its stage subprocesses
+# -------------------------
+class MemorySampler(threading.Thread):
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.interval = interval
+        self.pids = set()
+        self.peak_mb = 0.0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def add(self, pid: int):
+        with self._lock:
+            self.pids.add(pid)
+
+    def remove(self, pid: int):
+        with self._lock:
+            self.pids.discard(pid)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def sample(self) -> float:
+        with self._lock:
+            pids = list(self.pids)
+
+        total = 0
+        for pid in pids:
+            try:
+                root = psutil.Process(pid)
+                procs = [root] + root.children(recursive=True)
+            except psutil.NoSuchProcess:
+                continue
+
+            for proc in procs:
+                try:
+                    total += proc.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+
+        return total / (1024 * 1024)
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, self.sample())
+
+
+# -------------------------
+# Episodes
+# -------------------------
+def stage_latencies(work_dir: str, started_at: float) -> dict:
+    path = os.path.join(work_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        stages = json.load(f)["stages"]
+
+    # Stages complete in order; each one took the time since the last
+    latencies = {}
+    previous = started_at
+    for stage, entry in sorted(stages.items(), key=lambda item: item[1]["completed_at"]):
+        latencies[stage] = entry["completed_at"] - previous
+        previous = entry["completed_at"]
+
+    return latencies
+
+
+def run_one(index: int, experience_url: str, flags: list, env: dict, sampler: MemorySampler) -> dict:
+    work_dir = os.path.join(env["WORK_DIR"], episode_id(experience_url))
+    log_file = os.path.join(env["WORK_DIR"], f"episode-{index}.log")
+    cmd = [sys.executable, "main.py", experience_url, "-y"] + flags
+
+    started_at = time.time()
+    started = time.monotonic()
+
+    with open(log_file, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        sampler.add(proc.pid)
+        returncode = proc.wait()
+        sampler.remove(proc.pid)
+
+    seconds = time.monotonic() - started
+    if returncode:
+        logger.error("Episode %d failed (%s), see %s", index, experience_url, log_file)
+    else:
+        logger.info("Episode %d done in %.1fs", index, seconds)
+
+    return {
+        "experience_url": experience_url,
+        "returncode": returncode,
+        "seconds": seconds,
+        "stages": stage_latencies(work_dir, started_at),
+        "log": log_file,
+    }
+
+
+# -------------------------
+# Report
+# -------------------------
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(results: list, wall_seconds: float, peak_mb: float, concurrency: int, counts: dict) -> dict:
+    ok = [r for r in results if r["returncode"] == 0]
+
+    stages = {}
+    for result in ok:
+        for stage, seconds in result["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+    stages["episode"] = [r["seconds"] for r in ok]
+
+    return {
+        "episodes": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "concurrency": concurrency,
+        "wall_seconds": wall_seconds,
+        "episodes_per_hour": len(ok) / wall_seconds * 3600 if wall_seconds else 0.0,
+        "peak_memory_mb": peak_mb,
+        "stages": {
+            stage: {
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "max": max(values),
+            }
+            for stage, values in stages.items() if values
+        },
+        "services": counts,
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"episodes: {report['succeeded']}/{report['episodes']} ok "
+        f"at concurrency {report['concurrency']}"
+    )
+    print(
+        f"wall: {report['wall_seconds']:.1f}s  "
+        f"throughput: {report['episodes_per_hour']:.1f} episodes/hour"
+    )
+    print(f"peak memory: {report['peak_memory_mb']:.0f} MB")
+    print(f"{'stage':<12} {'p50':>8} {'p95':>8} {'max':>8}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<12} {row['p50']:>7.1f}s {row['p95']:>7.1f}s {row['max']:>7.1f}s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(threadName)s] [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end load test against local stand-in services"
+    )
+    parser.add_argument("-n", "--episodes", type=int, default=4, help="Episodes to run")
+    parser.add_argument("-c", "--concurrency", type=int, default=2, help="Concurrent main.py runs")
+    parser.add_argument("-g", "--gemini", action="store_true", help="Use the Gemini audio script")
+    parser.add_argument("-s", "--stream", action="store_true", help="Pass --stream to main.py")
+    parser.add_argument("-p", "--parallel", action="store_true", help="Pass --parallel to main.py")
+    parser.add_argument("--prerender", action="store_true", help="Pass --prerender to main.py")
+    parser.add_argument("--stub-tts", action="store_true", help="Replace VITS with a fast stub synthesizer")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each fake service response")
+    parser.add_argument("--fixtures", default=FIXTURES_FILE, help="Fixture reports JSON")
+    parser.add_argument(
+        "--work-dir",
+        help="Dir for work dirs, renders and the lease table (default: fresh temp dir)"
+    )
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--min-eph", type=float, help="Fail unless throughput reaches this many episodes/hour")
+    parser.add_argument("--max-memory-mb", type=float, help="Fail if peak memory exceeds this")
+    args = parser.parse_args()
+
+    reports = load_fixtures(args.fixtures)
+    server, app, base_url = start_fake_services(reports, args.latency)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(work_dir, exist_ok=True)
+    env = harness_env(base_url, work_dir, args.stub_tts)
+    logger.info("Work dir: %s", work_dir)
+
+    flags = []
+    if args.gemini:
+        flags.append("--gemini")
+    if args.stream:
+        flags.append("--stream")
+    if args.parallel:
+        flags.append("--parallel")
+    if args.prerender:
+        flags.append("--prerender")
+
+    # Unique variants of the fixtures so nothing is served from a checkpoint
+    run_id = uuid.uuid4().hex[:6]
+    fixture_urls = list(reports)
+    urls = [
+        f"{fixture_urls[i % len(fixture_urls)]}&run={run_id}-{i}"
+        for i in range(args.episodes)
+    ]
+
+    sampler = MemorySampler()
+    sampler.start()
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(
+            lambda item: run_one(item[0], item[1], flags, env, sampler),
+            enumerate(urls),
+        ))
+
+    wall_seconds = time.monotonic() - started
+    sampler.stop()
+    server.shutdown()
+
+    report = summarize(
+        results, wall_seconds, sampler.peak_mb, args.concurrency, app.config["COUNTS"]
+    )
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    # -------------------------
+    # Capacity gate
+    # -------------------------
+    failed = report["failed"] > 0
+    if args.min_eph and report["episodes_per_hour"] < args.min_eph:
+        logger.error("Throughput %.1f below %.1f episodes/hour", report["episodes_per_hour"], args.min_eph)
+        failed = True
+    if args.max_memory_mb and report["peak_memory_mb"] > args.max_memory_mb:
+        logger.error("Peak memory %.0f MB above %.0f MB", report["peak_memory_mb"], args.max_memory_mb)
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -1,10 +1,13 @@
-import subprocess
 import logging
 import sys
 import os
 from dotenv import load_dotenv
 import argparse
 
+import catalog
+import profiling
+from pipeline import run_episode, PipelineError
+
 load_dotenv()
 
 logging.basicConfig(
@@ -13,11 +16,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-AUDIO_SCRIPT = "audio.py"
-GEMINI_AUDIO_SCRIPT = "audio_gemini.py"
-VIDEO_SCRIPT = "video.py"
-YT_SCRIPT = "yt.py"
-
 # -------------------------
 # Argument parsing
 # -------------------------
@@ -25,111 +23,151 @@ parser = argparse.ArgumentParser(description="Run Lysergic Podcast pipeline")
 parser.add_argument("experience_url", nargs="?", help="URL or path of the experience")
 parser.add_argument("-y", "--yes", action="store_true", help="Auto-upload to YouTube")
 parser.add_argument("-g", "--gemini", action="store_true", help="Use Gemini audio script")
+parser.add_argument(
+    "-s", "--stream",
+    action="store_true",
+    help=(
+        "Encode video while synthesizing (no intermediate WAV); "
+        "with -g, synthesize while Gemini is still responding"
+    )
+)
+parser.add_argument(
+    "-p", "--parallel",
+    action="store_true",
+    help="Encode video in parallel segments joined with stream copy"
+)
+parser.add_argument(
+    "-o", "--outputs",
+    help="Render several variants in one pass, e.g. landscape,shorts,preview"
+)
+parser.add_argument(
+    "-a", "--audio-only",
+    action="store_true",
+    help="Podcast episode only: no video, updates the RSS feed"
+)
+parser.add_argument(
+    "--podcast-format",
+    choices=["opus", "mp3"],
+    default="opus",
+    help="Audio format for --audio-only (default: opus)"
+)
+parser.add_argument(
+    "--soft-subs",
+    action="store_true",
+    help="Subtitles as a mov_text track + YouTube captions instead of burn-in"
+)
+parser.add_argument(
+    "--preview",
+    nargs="?",
+    const="2",
+    metavar="WINDOW",
+    help=(
+        "Fast low-res QA render instead of the final video: first N minutes "
+        "(default 2) or START-END (seconds or mm:ss); nothing is uploaded"
+    )
+)
+parser.add_argument(
+    "--prerender",
+    action="store_true",
+    help="Encode background + music from a predicted length while synthesizing"
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help=(
+        "Profile every stage: pstats, collapsed-stack flamegraph and torch "
+        "operator timings, saved next to the output as <name>.profile/"
+    )
+)
+parser.add_argument(
+    "--substance",
+    choices=list(catalog.SUBSTANCE_PAGES),
+    help="Random mode: pick an unnarrated catalog report for this substance"
+)
+parser.add_argument(
+    "--max-words",
+    type=int,
+    help="Random mode: only pick catalog reports up to this many words"
+)
 
 args = parser.parse_args()
 
-experience_url = args.experience_url
-auto_upload = args.yes
-use_gemini = args.gemini
+if args.audio_only and (args.stream or args.parallel or args.outputs or args.prerender):
+    parser.error("--audio-only renders no video; drop the video options")
 
-logger.info("experience_url=%s, auto_upload=%s, use_gemini=%s",
-            experience_url, auto_upload, use_gemini)
+# Variants crop and window the cues, so they are always burned in; a
+# caption track on top would show them twice
+if args.outputs and args.soft_subs:
+    parser.error("--outputs burns subtitles into every variant; drop --soft-subs")
 
-# -------------------------
-# Choose audio script
-# -------------------------
-audio_script = GEMINI_AUDIO_SCRIPT if use_gemini else AUDIO_SCRIPT
-logger.info("Running %s...", audio_script)
+if args.preview and (args.stream or args.audio_only or args.outputs):
+    parser.error("--preview renders from the narration WAV alone")
 
-cmd = ["python", audio_script]
-if experience_url:
-    cmd.append(experience_url)
+if args.preview:
+    # An optional WINDOW would otherwise swallow the URL: --preview URL
+    from video import parse_window
+    try:
+        parse_window(args.preview)
+    except ValueError:
+        parser.error(
+            f"--preview: invalid window {args.preview!r} (N minutes or START-END); "
+            "put the URL before a bare --preview"
+        )
 
-# -------------------------
-# Run audio script
-# -------------------------
-try:
-    result = subprocess.run(
-        cmd,
-        check=True,
-        text=True,
-        stdout=subprocess.PIPE
-    )
-except subprocess.CalledProcessError:
-    logger.error("%s failed!", audio_script)
-    sys.exit(1)
+experience_url = args.experience_url
+auto_upload = args.yes
+use_gemini = args.gemini
+stream = args.stream
 
-# -------------------------
-# Parse audio.py output
-# Expected:
-# audio.wav | subtitle.srt | primary_substance | experience_url
-# -------------------------
-output_line = result.stdout.strip().splitlines()[-1]
-parts = [p.strip() for p in output_line.split("|")]
+logger.info("experience_url=%s, auto_upload=%s, use_gemini=%s, stream=%s",
+            experience_url, auto_upload, use_gemini, stream)
 
-if len(parts) not in (3, 4):
-    logger.error("Unexpected audio.py output: %s", output_line)
-    sys.exit(1)
 
-audio_file = parts[0]
-subtitle_file = parts[1]
-primary_substance = parts[2]
-frontend_experience_url = parts[3] if len(parts) == 4 else None
+def confirm_upload(video_file: str) -> bool:
+    if auto_upload:
+        return True
 
-logger.info("Generated audio: %s", audio_file)
-logger.info("Generated subtitles: %s", subtitle_file)
-logger.info("Primary substance: %s", primary_substance)
+    answer = input("Upload video to YouTube? [y/n]: ").strip().lower()
+    return answer == "y"
 
-if frontend_experience_url:
-    logger.info("Experience URL: %s", frontend_experience_url)
 
 # -------------------------
-# Run video.py
+# Profiling
+# Stage scripts pick PROFILE_DIR up from the environment
 # -------------------------
-logger.info("Running video.py...")
-try:
-    result = subprocess.run(
-        ["python", VIDEO_SCRIPT, audio_file],
-        check=True,
-        text=True,
-        stdout=subprocess.PIPE
-    )
-except subprocess.CalledProcessError:
-    logger.error("video.py failed!")
-    sys.exit(1)
+profile_dir = None
+if args.profile:
+    profile_dir = profiling.new_profile_dir()
+    os.environ["PROFILE_DIR"] = profile_dir
+    logger.info("Profiling stages into %s", profile_dir)
 
-video_file = result.stdout.strip().splitlines()[-1]
-logger.info("Generated video: %s", video_file)
 
 # -------------------------
-# Upload to YouTube
+# Run pipeline
 # -------------------------
-logger.info("Preparing to upload to YouTube...")
-PLAYLIST_ID = os.getenv("YT_PLAYLIST_ID")
-
-if not auto_upload:
-    answer = input("Upload video to YouTube? [y/n]: ").strip().lower()
-    if answer != "y":
-        logger.info("Upload cancelled.")
-        sys.exit(0)
-
-logger.info("Uploading to YouTube...")
-yt_cmd = [
-    "python",
-    YT_SCRIPT,
-    video_file,
-    PLAYLIST_ID,
-    primary_substance,
-]
-
-if frontend_experience_url:
-    yt_cmd.append(frontend_experience_url)
-
 try:
-    subprocess.run(yt_cmd, check=True)
-except subprocess.CalledProcessError:
-    logger.error("YouTube upload failed!")
+    episode = run_episode(
+        experience_url,
+        use_gemini=use_gemini,
+        stream=stream,
+        parallel=args.parallel,
+        outputs=args.outputs,
+        confirm_upload=confirm_upload,
+        substance=args.substance,
+        max_words=args.max_words,
+        prerender=args.prerender,
+        podcast_format=args.podcast_format if args.audio_only else None,
+        preview=args.preview,
+        soft_subs=args.soft_subs,
+    )
+except PipelineError as e:
+    logger.error("%s", e)
+    if profile_dir:
+        logger.error("Profiles of the stages that ran: %s", profile_dir)
     sys.exit(1)
 
-logger.info("YouTube upload completed!")
+if profile_dir:
+    output_file = episode["video_file"] or episode["podcast_file"] or episode["preview_file"]
+    logger.info("Stage profiles: %s", profiling.place_profiles(profile_dir, output_file))
+
 logger.info("Pipeline completed successfully!")
@@ -0,0 +1,533 @@
+import subprocess
+import logging
+import time
+import os
+from urllib.parse import unquote
+
+import catalog
+import profiling
+from scheduler import default_scheduler
+from episode import (
+    episode_dir,
+    episode_lock,
+    load_manifest,
+    stage_valid,
+    record_stage,
+    stage_entry,
+    hash_file,
+)
+
+logger = logging.getLogger(__name__)
+
+AUDIO_SCRIPT = "audio.py"
+GEMINI_AUDIO_SCRIPT = "audio_gemini.py"
+VIDEO_SCRIPT = "video.py"
+YT_SCRIPT = "yt.py"
+PODCAST_SCRIPT = "podcast.py"
+
+SEGMENT_SECONDS = 60
+
+
+class PipelineError(Exception):
+    pass
+
+
+# -------------------------
+# Stage runner
+# A scheduler (see scheduler.py) admits the stage and hands it a
+# thread budget through the environment; without one the host-wide
+# default is used, so concurrent main.py runs share the machine.
+# With PROFILE_DIR set the script runs under profiling.py.
+# -------------------------
+def run_stage(stage: str, cmd: list, scheduler=None) -> str:
+    script = cmd[1]
+    scheduler = scheduler or default_scheduler()
+
+    cmd = profiling.profiled_cmd(stage, cmd)
+
+    env = os.environ.copy()
+    lease = scheduler.acquire(stage)
+
+    try:
+        env.update(lease.env())
+
+        result = subprocess.run(
+            cmd,
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+    except subprocess.CalledProcessError:
+        raise PipelineError(f"{script} failed!")
+    finally:
+        scheduler.release(lease)
+
+    return result.stdout.strip().splitlines()[-1]
+
+
+# -------------------------
+# Parse audio.py output
+# Expected:
+# audio.wav | subtitle.srt | primary_substance | experience_url [| video.mp4]
+# -------------------------
+def parse_audio_output(output_line: str) -> dict:
+    parts = [p.strip() for p in output_line.split("|")]
+
+    if len(parts) not in (3, 4, 5):
+        raise PipelineError(f"Unexpected audio.py output: {output_line}")
+
+    return {
+        "audio_file": parts[0],
+        "subtitle_file": parts[1],
+        "primary_substance": parts[2],
+        "experience_url": parts[3] if len(parts) >= 4 else None,
+        "video_file": parts[4] if len(parts) == 5 else None,
+    }
+
+
+# -------------------------
+# Stages
+# Each stage is checkpointed in the episode manifest, so any process
+# pointed at the same work dir can pick an episode up where it stopped
+# (see run_episode below and workqueue.py).
+# progress: progress(stage, fraction) callback
+# timings: dict that receives the seconds spent in each stage that ran
+# -------------------------
+def report(progress, stage: str, fraction: float):
+    if progress:
+        progress(stage, fraction)
+
+
+# -------------------------
+# In-process narration
+# Admitted through the scheduler like the audio.py stage, so warm
+# workers share the host budget with leased subprocess stages. The URL
+# is unquoted as audio.py does, so narration lands in the same work dir
+# that run_episode locks.
+# -------------------------
+def run_narrator(narrator, stage: str, experience_url, scheduler, progress) -> dict:
+    scheduler = scheduler or default_scheduler()
+    lease = scheduler.acquire(stage)
+
+    try:
+        lease.limit_torch()
+        return narrator(unquote(experience_url) if experience_url else None, progress)
+    finally:
+        scheduler.release(lease)
+
+
+# -------------------------
+# Audio
+# narrator: in-process synthesis, narrator(experience_url, progress) -> dict
+# shaped like parse_audio_output (warm workers, see server.py)
+# -------------------------
+def run_audio(
+    experience_url: str | None = None,
+    use_gemini: bool = False,
+    stream: bool = False,
+    prerender: bool = False,
+    scheduler=None,
+    narrator=None,
+    progress=None,
+    timings: dict | None = None,
+    soft_subs: bool = False,
+) -> dict:
+    audio_script = GEMINI_AUDIO_SCRIPT if use_gemini else AUDIO_SCRIPT
+    logger.info("Running %s...", audio_script)
+
+    cmd = ["python", audio_script]
+    if experience_url:
+        cmd.append(experience_url)
+
+    # Stream mode: audio.py pipes PCM into the encoder;
+    # audio_gemini.py streams Gemini's cleanup into synthesis
+    audio_stage = "audio"
+    if stream:
+        cmd.append("--stream")
+        if not use_gemini:
+            audio_stage = "stream"
+            if soft_subs:
+                cmd.append("--soft-subs")
+    elif prerender and not use_gemini:
+        # Background + music encode overlaps synthesis (see video.py --prerender)
+        audio_stage = "prerender"
+        cmd.append("--prerender")
+
+    report(progress, "audio", 0.0)
+    started = time.monotonic()
+
+    try:
+        if narrator:
+            narration = run_narrator(narrator, audio_stage, experience_url, scheduler, progress)
+        else:
+            narration = parse_audio_output(run_stage(audio_stage, cmd, scheduler))
+    except (PipelineError, RuntimeError) as e:
+        logger.error("Rerun with the same experience URL to resume")
+        raise PipelineError(str(e)) from e
+
+    if timings is not None:
+        timings["audio"] = time.monotonic() - started
+    report(progress, "audio", 1.0)
+
+    logger.info("Generated audio: %s", narration["audio_file"])
+    logger.info("Generated subtitles: %s", narration["subtitle_file"])
+    logger.info("Primary substance: %s", narration["primary_substance"])
+
+    if narration["experience_url"]:
+        logger.info("Experience URL: %s", narration["experience_url"])
+
+    # Audio artifacts live in the episode work dir
+    work_dir = os.path.dirname(narration["audio_file"])
+    logger.info("Episode work dir: %s", work_dir)
+
+    source_url = load_manifest(work_dir).get("experience_url")
+    if source_url:
+        catalog.mark_narrated(source_url)
+
+    return narration
+
+
+# -------------------------
+# Video
+# Stream mode already rendered (and checkpointed) the video
+# -------------------------
+def run_video(
+    narration: dict,
+    outputs: str | None = None,
+    parallel: bool = False,
+    scheduler=None,
+    progress=None,
+    timings: dict | None = None,
+    soft_subs: bool = False,
+) -> str:
+    audio_file = narration["audio_file"]
+    subtitle_file = narration["subtitle_file"]
+
+    if narration["video_file"]:
+        return narration["video_file"]
+
+    work_dir = os.path.dirname(audio_file)
+    manifest = load_manifest(work_dir)
+
+    video_inputs = {"audio": hash_file(audio_file)}
+    if os.path.exists(subtitle_file):
+        video_inputs["subtitles"] = hash_file(subtitle_file)
+    if soft_subs:
+        video_inputs["subtitle_mode"] = "soft"
+
+    if stage_valid(manifest, "video", video_inputs):
+        return stage_entry(manifest, "video")["outputs"]["video"]
+
+    video_cmd = ["python", VIDEO_SCRIPT, audio_file]
+    if soft_subs:
+        video_cmd.append("--soft-subs")
+
+    if outputs:
+        video_cmd += ["--outputs", outputs]
+    elif parallel:
+        video_cmd += ["--segment-seconds", str(SEGMENT_SECONDS)]
+    elif stage_valid(manifest, "background", {"audio": video_inputs["audio"]}):
+        # Only a background cut for this exact WAV
+        background_file = stage_entry(manifest, "background")["outputs"]["background"]
+        video_cmd += ["--background", background_file]
+
+    logger.info("Running video.py...")
+    report(progress, "video", 0.0)
+    started = time.monotonic()
+
+    try:
+        video_file = run_stage("video", video_cmd, scheduler)
+    except PipelineError:
+        logger.error("Audio is checkpointed in %s; rerun to resume", work_dir)
+        raise
+
+    if timings is not None:
+        timings["video"] = time.monotonic() - started
+    report(progress, "video", 1.0)
+
+    # video.py may have recorded the episode assets
+    manifest = load_manifest(work_dir)
+    record_stage(
+        work_dir, manifest, "video",
+        video_inputs,
+        {"video": video_file},
+    )
+
+    logger.info("Generated video: %s", video_file)
+    return video_file
+
+
+# -------------------------
+# QA preview
+# Low-res window through the same mix + subtitle filters; not checkpointed,
+# since it never stands in for the video stage
+# -------------------------
+def run_preview(
+    narration: dict,
+    window: str,
+    scheduler=None,
+    progress=None,
+    timings: dict | None = None,
+) -> str:
+    preview_cmd = ["python", VIDEO_SCRIPT, narration["audio_file"], "--preview", window]
+
+    logger.info("Running video.py preview (%s)...", window)
+    report(progress, "preview", 0.0)
+    started = time.monotonic()
+
+    preview_file = run_stage("video", preview_cmd, scheduler)
+
+    if timings is not None:
+        timings["preview"] = time.monotonic() - started
+    report(progress, "preview", 1.0)
+
+    logger.info("Generated preview: %s", preview_file)
+    return preview_file
+
+
+# -------------------------
+# Audio-only podcast
+# Narration + music bed encoded straight to Opus/MP3, RSS feed updated
+# -------------------------
+def run_podcast(
+    narration: dict,
+    podcast_format: str = "opus",
+    scheduler=None,
+    progress=None,
+    timings: dict | None = None,
+) -> str:
+    audio_file = narration["audio_file"]
+    subtitle_file = narration["subtitle_file"]
+
+    work_dir = os.path.dirname(audio_file)
+    manifest = load_manifest(work_dir)
+
+    podcast_inputs = {"audio": hash_file(audio_file), "format": podcast_format}
+    if os.path.exists(subtitle_file):
+        podcast_inputs["subtitles"] = hash_file(subtitle_file)
+
+    if stage_valid(manifest, "podcast", podcast_inputs):
+        return stage_entry(manifest, "podcast")["outputs"]["podcast"]
+
+    podcast_cmd = [
+        "python", PODCAST_SCRIPT, audio_file,
+        "--format", podcast_format,
+        "--substance", narration["primary_substance"],
+    ]
+    if narration["experience_url"]:
+        podcast_cmd += ["--link", narration["experience_url"]]
+
+    logger.info("Running podcast.py...")
+    report(progress, "podcast", 0.0)
+    started = time.monotonic()
+
+    try:
+        podcast_file = run_stage("podcast", podcast_cmd, scheduler)
+    except PipelineError:
+        logger.error("Audio is checkpointed in %s; rerun to resume", work_dir)
+        raise
+
+    if timings is not None:
+        timings["podcast"] = time.monotonic() - started
+    report(progress, "podcast", 1.0)
+
+    # podcast.py may have recorded the episode assets
+    manifest = load_manifest(work_dir)
+    record_stage(
+        work_dir, manifest, "podcast",
+        podcast_inputs,
+        {"podcast": podcast_file},
+    )
+
+    logger.info("Generated podcast episode: %s", podcast_file)
+    return podcast_file
+
+
+# -------------------------
+# Upload to YouTube
+# Returns the video id, or None when the upload was declined
+# -------------------------
+def run_upload(
+    narration: dict,
+    video_file: str,
+    confirm_upload=None,
+    scheduler=None,
+    progress=None,
+    timings: dict | None = None,
+    soft_subs: bool = False,
+) -> str | None:
+    work_dir = os.path.dirname(narration["audio_file"])
+    manifest = load_manifest(work_dir)
+
+    youtube_inputs = {"video": hash_file(video_file)}
+
+    if stage_valid(manifest, "youtube", youtube_inputs):
+        video_id = stage_entry(manifest, "youtube")["data"]["video_id"]
+        logger.info("Already uploaded to YouTube: %s", video_id)
+        return video_id
+
+    logger.info("Preparing to upload to YouTube...")
+    playlist_id = os.getenv("YT_PLAYLIST_ID", "")
+
+    if not confirm_upload or not confirm_upload(video_file):
+        logger.info("Upload cancelled.")
+        return None
+
+    logger.info("Uploading to YouTube...")
+    report(progress, "upload", 0.0)
+    started = time.monotonic()
+
+    yt_cmd = [
+        "python",
+        YT_SCRIPT,
+        video_file,
+        playlist_id,
+        narration["primary_substance"],
+    ]
+
+    if narration["experience_url"]:
+        yt_cmd.append(narration["experience_url"])
+
+    # Soft-subtitle renders carry no pixels of text; YouTube shows the track
+    if soft_subs and os.path.exists(narration["subtitle_file"]):
+        yt_cmd += ["--captions", narration["subtitle_file"]]
+
+    try:
+        video_id = run_stage("upload", yt_cmd, scheduler)
+    except PipelineError:
+        logger.error("YouTube upload failed!")
+        logger.error("Video is checkpointed in %s; rerun to resume", work_dir)
+        raise
+
+    if timings is not None:
+        timings["upload"] = time.monotonic() - started
+    report(progress, "upload", 1.0)
+
+    record_stage(
+        work_dir, manifest, "youtube",
+        youtube_inputs,
+        {},
+        {"video_id": video_id},
+    )
+
+    source_url = manifest.get("experience_url")
+    if source_url:
+        catalog.mark_uploaded(source_url, video_id)
+
+    logger.info("YouTube upload completed!")
+    return video_id
+
+
+# -------------------------
+# Episode pipeline
+# -------------------------
+def run_episode(
+    experience_url: str | None = None,
+    use_gemini: bool = False,
+    stream: bool = False,
+    parallel: bool = False,
+    outputs: str | None = None,
+    confirm_upload=None,
+    scheduler=None,
+    narrator=None,
+    progress=None,
+    substance: str | None = None,
+    max_words: int | None = None,
+    prerender: bool = False,
+    podcast_format: str | None = None,
+    preview: str | None = None,
+    soft_subs: bool = False,
+) -> dict:
+    timings = {}
+
+    if outputs and soft_subs:
+        raise PipelineError(
+            "Output variants burn their subtitles in; soft subtitles need a single output"
+        )
+
+    # -------------------------
+    # Random episodes are claimed through the catalog, so a report is
+    # never narrated twice (see catalog.pick_random)
+    # -------------------------
+    if not experience_url:
+        experience_url = catalog.pick_random(substance, max_words)
+        if not experience_url:
+            raise PipelineError("No unnarrated report found")
+
+    # -------------------------
+    # One run per episode work dir (manifest + narration files are shared)
+    # -------------------------
+    with episode_lock(episode_dir(unquote(experience_url))):
+        narration = run_audio(
+            experience_url,
+            use_gemini=use_gemini,
+            stream=stream,
+            prerender=prerender,
+            scheduler=scheduler,
+            narrator=narrator,
+            progress=progress,
+            timings=timings,
+            soft_subs=soft_subs,
+        )
+
+        episode = {
+            "work_dir": os.path.dirname(narration["audio_file"]),
+            "audio_file": narration["audio_file"],
+            "subtitle_file": narration["subtitle_file"],
+            "primary_substance": narration["primary_substance"],
+            "experience_url": narration["experience_url"],
+            "video_file": None,
+            "video_id": None,
+            "podcast_file": None,
+            "preview_file": None,
+            "timings": timings,
+        }
+
+        # -------------------------
+        # QA preview instead of the full render (nothing is uploaded)
+        # -------------------------
+        if preview:
+            episode["preview_file"] = run_preview(
+                narration,
+                preview,
+                scheduler=scheduler,
+                progress=progress,
+                timings=timings,
+            )
+            return episode
+
+        # -------------------------
+        # Audio-only fast path: no frames decoded or encoded
+        # -------------------------
+        if podcast_format:
+            episode["podcast_file"] = run_podcast(
+                narration,
+                podcast_format,
+                scheduler=scheduler,
+                progress=progress,
+                timings=timings,
+            )
+            return episode
+
+        episode["video_file"] = run_video(
+            narration,
+            outputs=outputs,
+            parallel=parallel,
+            scheduler=scheduler,
+            progress=progress,
+            timings=timings,
+            soft_subs=soft_subs,
+        )
+
+        episode["video_id"] = run_upload(
+            narration,
+            episode["video_file"],
+            confirm_upload=confirm_upload,
+            scheduler=scheduler,
+            progress=progress,
+            timings=timings,
+            soft_subs=soft_subs,
+        )
+
+        return episode
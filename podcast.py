@@ -0,0 +1,289 @@
+import os
+import fcntl
+import logging
+import argparse
+import subprocess
+from email.utils import formatdate
+import xml.etree.ElementTree as ET
+
+from dotenv import load_dotenv
+
+from video import (
+    OUTPUT_DIR,
+    TEMP_DIR,
+    episode_assets,
+    clean_srt,
+    parse_srt,
+    probe_duration,
+    mix_filter,
+    encoder_threads,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Formats
+# loudnorm resamples internally, so the output rate is always explicit
+# -------------------------
+PODCAST_FORMATS = {
+    "opus": {
+        "codec": "libopus",
+        "bitrate": "64k",
+        "sample_rate": 48000,
+        "mime": "audio/ogg",
+    },
+    "mp3": {
+        "codec": "libmp3lame",
+        "bitrate": "128k",
+        "sample_rate": 44100,
+        "mime": "audio/mpeg",
+    },
+}
+
+# Podcast loudness target (EBU R128 style, -16 LUFS for stereo/mobile)
+LOUDNORM = "loudnorm=I=-16:TP=-1.5:LRA=11"
+
+# Subtitle cues are sentences; chapters group them
+CHAPTER_SECONDS = 120
+CHAPTER_TITLE_CHARS = 60
+
+# -------------------------
+# Feed
+# -------------------------
+PODCAST_FEED = os.getenv("PODCAST_FEED") or os.path.join(OUTPUT_DIR, "feed.xml")
+PODCAST_BASE_URL = os.getenv("PODCAST_BASE_URL", "")
+PODCAST_TITLE = os.getenv("PODCAST_TITLE", "The Lysergic Podcast")
+LYSERGIC_FRONTEND = os.getenv("LYSERGIC_FRONTEND", "https://lysergic.vercel.app")
+
+ITUNES_NS = "http://www.itunes.com/dtds/podcast-1.0.dtd"
+ET.register_namespace("itunes", ITUNES_NS)
+
+
+# -------------------------
+# Chapters (FFmetadata)
+# -------------------------
+def escape_metadata(value: str) -> str:
+    for char in ("\\", "=", ";", "#", "\n"):
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def build_chapters(cues, duration: float):
+    chapters = []
+    for start, end, text in cues:
+        if not chapters or start >= chapters[-1]["start"] + CHAPTER_SECONDS:
+            title = text if len(text) <= CHAPTER_TITLE_CHARS else text[:CHAPTER_TITLE_CHARS].rstrip() + "..."
+            chapters.append({"start": start, "title": title})
+
+    for chapter, following in zip(chapters, chapters[1:] + [None]):
+        chapter["end"] = following["start"] if following else duration
+
+    return chapters
+
+
+def write_metadata(path: str, title: str, chapters):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(";FFMETADATA1\n")
+        f.write(f"title={escape_metadata(title)}\n")
+
+        for chapter in chapters:
+            f.write(
+                "[CHAPTER]\n"
+                "TIMEBASE=1/1000\n"
+                f"START={int(chapter['start'] * 1000)}\n"
+                f"END={int(chapter['end'] * 1000)}\n"
+                f"title={escape_metadata(chapter['title'])}\n"
+            )
+
+
+# -------------------------
+# Render
+# Narration + music bed -> loudness-normalized Opus/MP3, no video at all
+# -------------------------
+def render_podcast(
+    tts_audio_file: str,
+    subtitle_file: str | None,
+    music_file: str,
+    output_file: str,
+    title: str,
+    podcast_format: str = "opus",
+):
+    spec = PODCAST_FORMATS[podcast_format]
+    duration = probe_duration(tts_audio_file)
+
+    base_name = os.path.splitext(os.path.basename(output_file))[0]
+    metadata_file = os.path.join(TEMP_DIR, f"{base_name}.ffmetadata")
+
+    chapters = build_chapters(parse_srt(subtitle_file), duration) if subtitle_file else []
+    write_metadata(metadata_file, title, chapters)
+
+    logger.info(
+        "Rendering %s podcast (%d chapters): %s",
+        podcast_format, len(chapters), output_file
+    )
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-i", tts_audio_file,
+        "-stream_loop", "-1",
+        "-i", music_file,
+        "-i", metadata_file,
+        "-filter_complex", mix_filter("0:a", "1:a") + f";[mix]{LOUDNORM}[out]",
+        "-map", "[out]",
+        "-map_metadata", "2",
+        "-map_chapters", "2",
+        "-c:a", spec["codec"],
+        "-b:a", spec["bitrate"],
+        "-ar", str(spec["sample_rate"]),
+        "-threads", str(encoder_threads(0)),
+    ]
+    if podcast_format == "mp3":
+        # ID3v2.3 CHAP frames are what podcast apps read
+        ffmpeg_cmd += ["-id3v2_version", "3"]
+
+    ffmpeg_cmd.append(output_file)
+    subprocess.run(ffmpeg_cmd, check=True)
+
+    os.remove(metadata_file)
+    return duration
+
+
+# -------------------------
+# RSS feed
+# Rewritten in place: the new episode goes on top, a rerun of the same
+# episode replaces its item. A lock file serializes concurrent episodes.
+# -------------------------
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02}:{(seconds // 60) % 60:02}:{seconds % 60:02}"
+
+
+def load_feed(feed_file: str) -> ET.ElementTree:
+    if os.path.exists(feed_file):
+        return ET.parse(feed_file)
+
+    rss = ET.Element("rss", {"version": "2.0"})
+    channel = ET.SubElement(rss, "channel")
+    ET.SubElement(channel, "title").text = PODCAST_TITLE
+    ET.SubElement(channel, "link").text = LYSERGIC_FRONTEND
+    ET.SubElement(channel, "description").text = (
+        "Narrated psychoactive experience reports from Erowid.org. "
+        "Educational & harm reduction purposes only."
+    )
+    ET.SubElement(channel, "language").text = "en"
+    ET.SubElement(channel, f"{{{ITUNES_NS}}}explicit").text = "true"
+    return ET.ElementTree(rss)
+
+
+def update_feed(
+    feed_file: str,
+    podcast_file: str,
+    title: str,
+    duration: float,
+    podcast_format: str,
+    experience_url: str | None = None,
+):
+    # Podcast clients reject relative enclosure URLs
+    if not PODCAST_BASE_URL:
+        raise RuntimeError("PODCAST_BASE_URL is not set; the feed needs absolute enclosure URLs")
+
+    guid = os.path.splitext(os.path.basename(podcast_file))[0]
+    enclosure_url = f"{PODCAST_BASE_URL.rstrip('/')}/{os.path.basename(podcast_file)}"
+
+    os.makedirs(os.path.dirname(feed_file) or ".", exist_ok=True)
+
+    with open(feed_file + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        tree = load_feed(feed_file)
+        channel = tree.getroot().find("channel")
+
+        for item in channel.findall("item"):
+            if item.findtext("guid") == guid:
+                channel.remove(item)
+
+        item = ET.Element("item")
+        ET.SubElement(item, "title").text = title
+        ET.SubElement(item, "description").text = (
+            f"Read the full experience: {experience_url}" if experience_url
+            else "Narrated experience report from Erowid.org."
+        )
+        if experience_url:
+            ET.SubElement(item, "link").text = experience_url
+        ET.SubElement(item, "guid", {"isPermaLink": "false"}).text = guid
+        ET.SubElement(item, "pubDate").text = formatdate(usegmt=True)
+        ET.SubElement(item, "enclosure", {
+            "url": enclosure_url,
+            "length": str(os.path.getsize(podcast_file)),
+            "type": PODCAST_FORMATS[podcast_format]["mime"],
+        })
+        ET.SubElement(item, f"{{{ITUNES_NS}}}duration").text = format_duration(duration)
+
+        # Newest first, after the channel metadata
+        items = channel.findall("item")
+        position = list(channel).index(items[0]) if items else len(channel)
+        channel.insert(position, item)
+
+        ET.indent(tree)
+        tmp_file = feed_file + ".tmp"
+        tree.write(tmp_file, encoding="utf-8", xml_declaration=True)
+        os.replace(tmp_file, feed_file)
+
+    logger.info("Feed updated: %s", feed_file)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Render an audio-only podcast episode")
+    parser.add_argument("tts_audio_file", help="Narration WAV (names the output)")
+    parser.add_argument("-f", "--format", choices=list(PODCAST_FORMATS), default="opus")
+    parser.add_argument("--substance", help="Primary substance (episode title)")
+    parser.add_argument("--link", help="Frontend experience link")
+    parser.add_argument("--feed", default=PODCAST_FEED, help="RSS feed file to update")
+    args = parser.parse_args()
+
+    # Checked before the encode rather than after it
+    if not PODCAST_BASE_URL:
+        parser.error("PODCAST_BASE_URL is not set; the feed needs absolute enclosure URLs")
+
+    tts_audio_file = args.tts_audio_file
+    base_name = os.path.splitext(os.path.basename(tts_audio_file))[0]
+    subtitle_file = os.path.splitext(tts_audio_file)[0] + ".srt"
+
+    base_title = base_name.replace("_", " ")
+    title = f"{base_title} [{args.substance} Trip Report]" if args.substance else base_title
+
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    has_subtitles = os.path.exists(subtitle_file)
+    temp_subtitle = os.path.join(TEMP_DIR, f"{base_name}.srt")
+    if has_subtitles:
+        clean_srt(subtitle_file, temp_subtitle)
+
+    output_file = os.path.join(OUTPUT_DIR, f"{base_name}.{args.format}")
+
+    duration = render_podcast(
+        tts_audio_file,
+        temp_subtitle if has_subtitles else None,
+        # Same music as the episode's video and preview
+        episode_assets(os.path.dirname(tts_audio_file) or ".")["music"]["path"],
+        output_file,
+        title,
+        args.format,
+    )
+
+    if has_subtitles:
+        os.remove(temp_subtitle)
+
+    update_feed(args.feed, output_file, title, duration, args.format, args.link)
+
+    logger.info("Podcast episode ready: %s", output_file)
+    print(output_file)
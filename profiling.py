@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import runpy
+import shutil
+import pstats
+import cProfile
+import logging
+import argparse
+import threading
+import contextlib
+from collections import Counter
+
+from dotenv import load_dotenv
+
+# main.py imports this before its own load_dotenv(); OUTPUT_DIR is read below
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Config
+# PROFILE_DIR switches profiling on: pipeline stages are then run through
+# this script and write their artifacts there (see main.py --profile)
+# -------------------------
+PROFILE_ROOT = os.path.join(os.getenv("OUTPUT_DIR") or "output", "profiles")
+
+# Wall-clock stack sampling; 5 ms keeps the sampler itself under ~1% CPU
+SAMPLE_SECONDS = 0.005
+
+SUMMARY_ROWS = 40
+TORCH_ROWS = 40
+
+# Torch records a few segments per cycle instead of the whole episode,
+# which would hold every op event in memory: skip 1, warm up 1, record 5,
+# three times over
+TORCH_WAIT = 1
+TORCH_WARMUP = 1
+TORCH_ACTIVE = 5
+TORCH_REPEAT = 3
+
+PROFILE_SCRIPT = "profiling.py"
+
+
+# -------------------------
+# Stack sampler
+# Samples every thread, idle or not, so time spent waiting on ffmpeg or
+# the network shows up too. Output is the collapsed-stack format read by
+# flamegraph.pl and speedscope: "thread;outer;...;inner count"
+# -------------------------
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+WRAPPER_FILES = {__file__, runpy.__file__, "<frozen runpy>"}
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, interval: float = SAMPLE_SECONDS):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.samples = Counter()
+        self._done = threading.Event()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(frame)
+                    frame = frame.f_back
+                stack.reverse()
+
+                # Drop the profile_script / runpy frames above the stage script
+                while stack and stack[0].f_code.co_filename in WRAPPER_FILES:
+                    stack.pop(0)
+
+                labels = [names.get(thread_id, "thread")] + [frame_label(f) for f in stack]
+                self.samples[";".join(labels)] += 1
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# -------------------------
+# Torch operator timings
+# Wraps a synthesis loop and yields step(), to be called once per
+# segment; a no-op unless the stage is being profiled
+# -------------------------
+@contextlib.contextmanager
+def torch_ops(label: str):
+    profile_dir = os.getenv("PROFILE_DIR")
+    if not profile_dir:
+        yield lambda: None
+        return
+
+    from torch.profiler import profile, schedule, ProfilerActivity
+
+    tables = []
+
+    def collect(prof):
+        tables.append((prof.step_num, prof.key_averages().table(
+            sort_by="self_cpu_time_total",
+            row_limit=TORCH_ROWS,
+        )))
+
+    with profile(
+        activities=[ProfilerActivity.CPU],
+        schedule=schedule(
+            wait=TORCH_WAIT,
+            warmup=TORCH_WARMUP,
+            active=TORCH_ACTIVE,
+            repeat=TORCH_REPEAT,
+        ),
+        on_trace_ready=collect,
+    ) as prof:
+        yield prof.step
+
+    stage = os.getenv("PROFILE_STAGE", label)
+    path = os.path.join(profile_dir, f"{stage}.torch.txt")
+
+    with open(path, "a", encoding="utf-8") as f:
+        if not tables:
+            f.write(f"# {label}: too few segments to record\n")
+        for step_num, table in tables:
+            f.write(f"# {label}, up to segment {step_num}\n")
+            f.write(table)
+            f.write("\n")
+
+    logger.info("Torch operator timings: %s", path)
+
+
+# -------------------------
+# Stage runner
+# Runs a stage script as __main__ under cProfile (deterministic, main
+# thread) and the stack sampler (all threads). The script's stdout is
+# untouched, so the pipeline hand-off line still comes through.
+# Python children started through profiled_cmd get their own artifacts;
+# ffmpeg is not profiled and only shows up as waits in its parent.
+# -------------------------
+def profiled_cmd(stage: str, cmd: list) -> list:
+    # ["python", script, *args] -> the same script run under this one
+    profile_dir = os.getenv("PROFILE_DIR")
+    if not profile_dir:
+        return cmd
+    return [cmd[0], PROFILE_SCRIPT, "--stage", stage, "--out", profile_dir] + cmd[1:]
+
+
+def profile_script(stage: str, profile_dir: str, script: str, args: list):
+    os.makedirs(profile_dir, exist_ok=True)
+    os.environ["PROFILE_DIR"] = profile_dir
+    os.environ["PROFILE_STAGE"] = stage
+
+    sys.argv = [script] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    profiler = cProfile.Profile()
+    sampler = StackSampler()
+
+    started = time.monotonic()
+    sampler.start()
+    profiler.enable()
+
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        profiler.disable()
+        sampler.stop()
+        elapsed = time.monotonic() - started
+
+        prefix = os.path.join(profile_dir, stage)
+        profiler.dump_stats(prefix + ".pstats")
+        sampler.write(prefix + ".collapsed")
+
+        with open(prefix + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"{stage}: {script} {' '.join(args)}\n")
+            f.write(f"wall time: {elapsed:.1f}s\n")
+            f.write(
+                "not profiled: ffmpeg subprocesses (their time shows as waits "
+                "in subprocess frames); Python children have their own files\n"
+            )
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats("cumulative").print_stats(SUMMARY_ROWS)
+
+        logger.info("Profiled %s stage (%.1fs): %s.*", stage, elapsed, prefix)
+
+
+# -------------------------
+# Artifact placement
+# Stages write into a fresh dir; once the episode has an output file
+# the dir is moved next to it as <output>.profile/
+# -------------------------
+def new_profile_dir() -> str:
+    profile_dir = os.path.join(PROFILE_ROOT, time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+def place_profiles(profile_dir: str, output_file: str | None) -> str:
+    if not output_file:
+        return profile_dir
+
+    target = os.path.splitext(output_file)[0] + ".profile"
+    if os.path.exists(target):
+        shutil.rmtree(target)
+
+    shutil.move(profile_dir, target)
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a pipeline stage script under the profilers")
+    parser.add_argument("--stage", required=True, help="Stage name (artifact prefix)")
+    parser.add_argument("--out", required=True, help="Profile directory")
+    parser.add_argument("script", help="Stage script, e.g. audio.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the script")
+    args = parser.parse_args()
+
+    profile_script(args.stage, args.out, args.script, args.args)
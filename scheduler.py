@@ -0,0 +1,268 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+# SCHEDULER_DB is read at import, before any entry point loads .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Stage profiles
+# cpus: threads the stage is allowed to use (torch intra-op / x264)
+# encoder_cpus: share of cpus reserved for an encoder running next to
+# torch in the same stage (stream mode, background pre-render), so the
+# two don't oversubscribe
+# memory_mb: resident peak we budget for
+# priority: lower runs first, so in-flight episodes drain (upload,
+# encode) before new synthesis starts and every resource stays busy
+# -------------------------
+STAGE_PROFILES = {
+    "upload": {"cpus": 1, "memory_mb": 300, "priority": 0},
+    "podcast": {"cpus": 1, "memory_mb": 300, "priority": 1},
+    "video": {"cpus": 4, "memory_mb": 1500, "priority": 1},
+    "stream": {"cpus": 8, "encoder_cpus": 4, "memory_mb": 4000, "priority": 1},
+    "audio": {"cpus": 4, "memory_mb": 2500, "priority": 2},
+    "prerender": {"cpus": 4, "encoder_cpus": 2, "memory_mb": 3000, "priority": 2},
+}
+
+# Keep headroom for the OS and the Python drivers themselves
+MEMORY_FRACTION = 0.85
+
+# -------------------------
+# Lease table
+# Host-local (never on shared storage): every pipeline process on this
+# machine admits its stages through it, so separate main.py runs share
+# one budget. Rows of dead processes are dropped on the next admission.
+# -------------------------
+SCHEDULER_DB = os.getenv(
+    "SCHEDULER_DB", os.path.join(tempfile.gettempdir(), "lysergic-scheduler.db")
+)
+POLL_SECONDS = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    cpus INTEGER NOT NULL,
+    memory_mb INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'waiting',
+    created_at REAL NOT NULL
+);
+"""
+
+
+def total_memory_mb() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Lease:
+    def __init__(self, lease_id: int, stage: str, cpus: int, memory_mb: int, encoder_cpus: int = 0):
+        self.id = lease_id
+        self.stage = stage
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.encoder_cpus = encoder_cpus
+
+    def env(self) -> dict:
+        torch_threads = str(self.cpus - self.encoder_cpus if self.encoder_cpus else self.cpus)
+        encoder_threads = str(self.encoder_cpus or self.cpus)
+
+        # torch reads OMP/MKL at import; video.py reads ENCODER_THREADS
+        return {
+            "OMP_NUM_THREADS": torch_threads,
+            "MKL_NUM_THREADS": torch_threads,
+            "ENCODER_THREADS": encoder_threads,
+        }
+
+    def limit_torch(self):
+        # In-process synthesis (server.py warm workers): torch is already
+        # loaded, too late for OMP_NUM_THREADS, so size its pool directly
+        torch = sys.modules.get("torch")
+        if torch:
+            torch.set_num_threads(int(self.env()["OMP_NUM_THREADS"]))
+
+
+class Scheduler:
+    def __init__(
+        self,
+        cpus: int | None = None,
+        memory_mb: int | None = None,
+        path: str = SCHEDULER_DB,
+    ):
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory_mb = memory_mb or int(total_memory_mb() * MEMORY_FRACTION)
+        self.path = path
+
+        logger.info(
+            "Scheduler budget: %d cpus, %d MB", self.cpus, self.memory_mb
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _request(self, stage: str):
+        profile = STAGE_PROFILES[stage]
+
+        # A stage never asks for more than the whole box, or it would never run
+        cpus = min(profile["cpus"], self.cpus)
+        encoder_cpus = min(profile.get("encoder_cpus", 0), cpus - 1)
+        return cpus, min(profile["memory_mb"], self.memory_mb), encoder_cpus
+
+    def _try_admit(self, lease_id: int) -> bool:
+        conn = self._connect()
+        try:
+            # IMMEDIATE: one process at a time looks at the free budget
+            conn.execute("BEGIN IMMEDIATE")
+
+            rows = conn.execute("SELECT * FROM leases ORDER BY priority, id").fetchall()
+            dead = [row["id"] for row in rows if not pid_alive(row["pid"])]
+            for dead_id in dead:
+                conn.execute("DELETE FROM leases WHERE id = ?", (dead_id,))
+
+            rows = [row for row in rows if row["id"] not in dead]
+            running = [row for row in rows if row["status"] == "running"]
+            free_cpus = self.cpus - sum(row["cpus"] for row in running)
+            free_memory_mb = self.memory_mb - sum(row["memory_mb"] for row in running)
+
+            # Highest priority waiter that fits; FIFO within a priority
+            admitted = False
+            for row in rows:
+                if row["status"] != "waiting":
+                    continue
+                if row["cpus"] <= free_cpus and row["memory_mb"] <= free_memory_mb:
+                    if row["id"] == lease_id:
+                        conn.execute(
+                            "UPDATE leases SET status = 'running' WHERE id = ?", (lease_id,)
+                        )
+                        admitted = True
+                    break
+
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        return admitted
+
+    def acquire(self, stage: str) -> Lease:
+        cpus, memory_mb, encoder_cpus = self._request(stage)
+
+        with closing(self._connect()) as conn:
+            lease_id = conn.execute(
+                "INSERT INTO leases (stage, priority, cpus, memory_mb, pid, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (stage, STAGE_PROFILES[stage]["priority"], cpus, memory_mb,
+                 os.getpid(), time.time()),
+            ).lastrowid
+
+        try:
+            while not self._try_admit(lease_id):
+                time.sleep(POLL_SECONDS)
+        except BaseException:
+            self._delete(lease_id)
+            raise
+
+        logger.info("Admitted %s (%d cpus, %d MB)", stage, cpus, memory_mb)
+        return Lease(lease_id, stage, cpus, memory_mb, encoder_cpus)
+
+    def _delete(self, lease_id: int):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+
+    def release(self, lease: Lease):
+        self._delete(lease.id)
+        logger.info("Released %s", lease.stage)
+
+
+# -------------------------
+# Default scheduler
+# Used by pipeline.run_stage when the caller brings none
+# -------------------------
+_default = None
+
+
+def default_scheduler() -> Scheduler:
+    global _default
+    if _default is None:
+        _default = Scheduler()
+    return _default
+
+
+if __name__ == "__main__":
+    from pipeline import run_episode, PipelineError
+
+    load_dotenv()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(threadName)s] [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Run several episodes with resource-aware stage scheduling"
+    )
+    parser.add_argument("experience_urls", nargs="*", help="Experience URLs")
+    parser.add_argument(
+        "-n", "--random",
+        type=int,
+        default=0,
+        help="Number of additional random episodes"
+    )
+    parser.add_argument("-y", "--yes", action="store_true", help="Auto-upload to YouTube")
+    parser.add_argument("-g", "--gemini", action="store_true", help="Use Gemini audio script")
+    parser.add_argument("-p", "--parallel", action="store_true", help="Segment-parallel encode")
+    parser.add_argument("--cpus", type=int, help="CPU budget (default: all cores)")
+    parser.add_argument("--memory-mb", type=int, help="Memory budget in MB")
+    args = parser.parse_args()
+
+    jobs = args.experience_urls + [None] * args.random
+    if not jobs:
+        parser.error("give experience URLs and/or --random N")
+
+    scheduler = Scheduler(args.cpus, args.memory_mb)
+
+    def run(experience_url):
+        return run_episode(
+            experience_url,
+            use_gemini=args.gemini,
+            parallel=args.parallel,
+            confirm_upload=(lambda video_file: True) if args.yes else None,
+            scheduler=scheduler,
+        )
+
+    # Admission is the scheduler's job; every episode gets a driver thread
+    failed = 0
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(run, url) for url in jobs]
+        for future in futures:
+            try:
+                episode = future.result()
+                logger.info("Episode done: %s", episode["video_file"])
+            except PipelineError as e:
+                failed += 1
+                logger.error("%s", e)
+
+    logger.info("%d/%d episodes completed", len(jobs) - failed, len(jobs))
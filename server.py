@@ -0,0 +1,261 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+
+from dotenv import load_dotenv
+from flask import Flask, jsonify, request, send_file, abort
+
+import catalog
+from pipeline import run_episode, PipelineError
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(threadName)s] [%(levelname)s] %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+WORKERS = int(os.getenv("WORKERS", "1"))
+# >0: synthesis runs in forked processes sharing one model (synth_pool.py)
+SYNTH_WORKERS = int(os.getenv("SYNTH_WORKERS", "0"))
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "5000"))
+
+ARTIFACTS = ("audio_file", "subtitle_file", "video_file")
+
+app = Flask(__name__)
+
+jobs = {}
+active_by_key = {}
+jobs_lock = threading.Lock()
+job_queue = queue.Queue()
+synth_pool = None
+
+
+# -------------------------
+# Jobs
+# -------------------------
+def job_key(experience_url: str | None, use_gemini: bool):
+    # Random episodes are never coalesced. Jobs with different keys for
+    # the same report share a work dir; run_episode serializes them on
+    # the episode lock.
+    if not experience_url:
+        return None
+    return (experience_url, use_gemini)
+
+
+def job_view(job: dict) -> dict:
+    return {
+        key: job[key]
+        for key in (
+            "id", "status", "experience_url", "gemini", "upload",
+            "substance", "max_words",
+            "stage", "progress", "timings", "artifacts", "video_id",
+            "error", "created_at", "finished_at",
+        )
+    }
+
+
+def submit(
+    experience_url: str | None,
+    use_gemini: bool,
+    upload: bool,
+    substance: str | None = None,
+    max_words: int | None = None,
+) -> dict:
+    key = job_key(experience_url, use_gemini)
+
+    with jobs_lock:
+        if key in active_by_key:
+            job = active_by_key[key]
+            # A later request for the same report may ask for the upload
+            job["upload"] = job["upload"] or upload
+            logger.info("Coalesced request into job %s", job["id"])
+            return job
+
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "status": "queued",
+            "experience_url": experience_url,
+            "gemini": use_gemini,
+            "upload": upload,
+            "substance": substance,
+            "max_words": max_words,
+            "stage": None,
+            "progress": 0.0,
+            "timings": {},
+            "artifacts": {},
+            "video_id": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        jobs[job["id"]] = job
+        if key:
+            active_by_key[key] = job
+
+    job_queue.put(job)
+    return job
+
+
+# -------------------------
+# Warm workers
+# Each worker loads the TTS model once and keeps it for every job,
+# unless synthesis goes to the shared-model pool.
+# -------------------------
+def worker():
+    tts = None
+
+    if not synth_pool:
+        import audio
+
+        tts = audio.load_tts()
+        logger.info("Worker ready (TTS model loaded)")
+
+    while True:
+        job = job_queue.get()
+        try:
+            run_job(job, tts)
+        except Exception:
+            # run_job records its own failures; never lose the worker
+            logger.exception("Worker error on job %s", job["id"])
+        finally:
+            job_queue.task_done()
+
+
+def run_job(job: dict, tts):
+    stage_started = {}
+
+    def progress(stage: str, fraction: float):
+        with jobs_lock:
+            if stage != job["stage"]:
+                stage_started[stage] = time.monotonic()
+            job["stage"] = stage
+            job["progress"] = fraction
+            job["timings"][stage] = time.monotonic() - stage_started[stage]
+
+    def narrator(experience_url, progress):
+        if synth_pool:
+            return synth_pool.narrate(experience_url, job["gemini"])
+
+        if job["gemini"]:
+            import audio_gemini
+            return audio_gemini.narrate(experience_url, tts=tts, progress=progress)
+
+        import audio
+        return audio.narrate(experience_url, tts=tts, progress=progress)
+
+    with jobs_lock:
+        job["status"] = "running"
+
+    try:
+        episode = run_episode(
+            job["experience_url"],
+            use_gemini=job["gemini"],
+            confirm_upload=lambda video_file: job["upload"],
+            narrator=narrator,
+            progress=progress,
+            substance=job["substance"],
+            max_words=job["max_words"],
+        )
+    except (PipelineError, RuntimeError) as e:
+        logger.error("Job %s failed: %s", job["id"], e)
+        with jobs_lock:
+            job["status"] = "failed"
+            job["error"] = str(e)
+    except Exception as e:
+        # Network errors from the catalog/API, bugs: fail the job, keep serving
+        logger.exception("Job %s failed", job["id"])
+        with jobs_lock:
+            job["status"] = "failed"
+            job["error"] = f"{type(e).__name__}: {e}"
+    else:
+        with jobs_lock:
+            job["status"] = "done"
+            job["timings"].update(episode["timings"])
+            job["artifacts"] = {
+                name: episode[name] for name in ARTIFACTS if episode.get(name)
+            }
+            job["video_id"] = episode["video_id"]
+    finally:
+        with jobs_lock:
+            job["finished_at"] = time.time()
+            key = job_key(job["experience_url"], job["gemini"])
+            if active_by_key.get(key) is job:
+                del active_by_key[key]
+
+
+# -------------------------
+# Routes
+# -------------------------
+@app.post("/jobs")
+def create_job():
+    body = request.get_json(silent=True) or {}
+
+    substance = body.get("substance")
+    if substance and substance not in catalog.SUBSTANCE_PAGES:
+        return jsonify({"error": f"Unknown substance: {substance}"}), 400
+
+    job = submit(
+        body.get("experience_url"),
+        bool(body.get("gemini", False)),
+        bool(body.get("upload", False)),
+        substance,
+        body.get("max_words"),
+    )
+
+    with jobs_lock:
+        return jsonify(job_view(job)), 202
+
+
+@app.get("/jobs")
+def list_jobs():
+    with jobs_lock:
+        return jsonify([job_view(job) for job in jobs.values()])
+
+
+@app.get("/jobs/<job_id>")
+def get_job(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if not job:
+            abort(404)
+        return jsonify(job_view(job))
+
+
+@app.get("/jobs/<job_id>/artifacts/<name>")
+def get_artifact(job_id, name):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        path = job["artifacts"].get(name) if job else None
+
+    if not path or not os.path.exists(path):
+        abort(404)
+
+    return send_file(os.path.abspath(path))
+
+
+@app.get("/workers/memory")
+def workers_memory():
+    if not synth_pool:
+        abort(404)
+    return jsonify(synth_pool.memory_report())
+
+
+if __name__ == "__main__":
+    # Fork before any thread exists
+    if SYNTH_WORKERS:
+        from synth_pool import SynthesisPool
+        synth_pool = SynthesisPool(SYNTH_WORKERS)
+
+    for i in range(WORKERS):
+        threading.Thread(target=worker, name=f"worker-{i}", daemon=True).start()
+
+    app.run(host=HOST, port=PORT, threaded=True)
@@ -0,0 +1,164 @@
+import os
+import gc
+import sys
+import logging
+import argparse
+import multiprocessing
+
+import psutil
+import torch
+from dotenv import load_dotenv
+
+import audio
+import frontend
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Shared model
+# Loaded once in the parent; forked workers inherit it and share the
+# weight pages copy-on-write for as long as nobody writes to them.
+# -------------------------
+_tts = None
+
+
+def load_shared_tts(threads: int):
+    # Set before the model exists so every forked worker inherits it,
+    # and never run inference in the parent: a used OpenMP pool does not
+    # survive fork()
+    torch.set_num_threads(threads)
+    torch.set_grad_enabled(False)
+
+    tts = audio.load_tts()
+
+    model = getattr(tts.synthesizer, "tts_model", None)
+    if model is not None:
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+
+    # Read the persisted phoneme cache once, before the fork
+    frontend.frontend_for(tts)
+
+    return tts
+
+
+def _narrate(experience_url, use_gemini: bool, prerender: bool) -> dict:
+    if use_gemini:
+        import audio_gemini
+        return audio_gemini.narrate(experience_url, tts=_tts)
+
+    return audio.narrate(experience_url, tts=_tts, prerender=prerender)
+
+
+# -------------------------
+# Pool
+# -------------------------
+class SynthesisPool:
+    def __init__(self, workers: int, threads: int | None = None):
+        global _tts
+
+        threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        logger.info("Loading shared TTS model (%d threads per worker)", threads)
+        _tts = load_shared_tts(threads)
+
+        # Keep the collector from writing to every inherited object header
+        gc.freeze()
+
+        self.workers = workers
+        self._pool = multiprocessing.get_context("fork").Pool(workers)
+        logger.info("Forked %d synthesis workers", workers)
+
+    def submit(self, experience_url=None, use_gemini: bool = False, prerender: bool = False):
+        return self._pool.apply_async(_narrate, (experience_url, use_gemini, prerender))
+
+    def narrate(self, experience_url=None, use_gemini: bool = False, prerender: bool = False) -> dict:
+        return self.submit(experience_url, use_gemini, prerender).get()
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    # -------------------------
+    # Memory report
+    # USS is what each process costs on its own; the shared weights
+    # show up in RSS (and are split across processes in PSS)
+    # -------------------------
+    def memory_report(self) -> list:
+        procs = [("parent", psutil.Process())] + [
+            ("worker", psutil.Process(child.pid))
+            for child in multiprocessing.active_children()
+        ]
+
+        rows = []
+        for role, proc in procs:
+            try:
+                info = proc.memory_full_info()
+            except psutil.NoSuchProcess:
+                continue
+
+            rows.append({
+                "pid": proc.pid,
+                "role": role,
+                "rss_mb": info.rss / (1024 * 1024),
+                "pss_mb": getattr(info, "pss", 0) / (1024 * 1024),
+                "uss_mb": info.uss / (1024 * 1024),
+            })
+
+        return rows
+
+
+def print_memory_report(rows: list):
+    print(f"{'role':<8} {'pid':>7} {'rss':>9} {'pss':>9} {'uss':>9}")
+    for row in rows:
+        print(
+            f"{row['role']:<8} {row['pid']:>7} "
+            f"{row['rss_mb']:>6.0f} MB {row['pss_mb']:>6.0f} MB {row['uss_mb']:>6.0f} MB"
+        )
+
+    workers = [row for row in rows if row["role"] == "worker"]
+    if workers:
+        print(
+            f"unique per worker: {sum(r['uss_mb'] for r in workers) / len(workers):.0f} MB | "
+            f"total: {sum(r['pss_mb'] for r in rows):.0f} MB PSS"
+        )
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(processName)s] [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Narrate several episodes with forked workers sharing one TTS model"
+    )
+    parser.add_argument("experience_urls", nargs="*", help="Experience URLs")
+    parser.add_argument("-n", "--random", type=int, default=0, help="Number of additional random episodes")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Synthesis worker processes")
+    parser.add_argument("-t", "--threads", type=int, help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument("-g", "--gemini", action="store_true", help="Use the Gemini audio script")
+    args = parser.parse_args()
+
+    jobs = args.experience_urls + [None] * args.random
+    if not jobs:
+        parser.error("give experience URLs and/or --random N")
+
+    pool = SynthesisPool(args.workers, args.threads)
+    pending = [pool.submit(url, args.gemini) for url in jobs]
+
+    failed = 0
+    for result in pending:
+        try:
+            print(audio.format_output(result.get()))
+        except RuntimeError as e:
+            failed += 1
+            logger.error("%s", e)
+
+    # Taken while the workers are still alive, after they have synthesized
+    print_memory_report(pool.memory_report())
+    pool.close()
+
+    sys.exit(1 if failed else 0)
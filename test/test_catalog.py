@@ -0,0 +1,63 @@
+import os
+import sys
+from contextlib import closing
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import catalog
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "catalog.db")
+    real_connect = catalog.connect
+    monkeypatch.setattr(catalog, "connect", lambda path=path: real_connect(path))
+    return path
+
+
+# -------------------------
+# Claims
+# -------------------------
+def test_claim_is_taken_once(db):
+    url = "https://www.erowid.org/experiences/exp.php?ID=1"
+
+    assert catalog.claim(url)
+    assert not catalog.claim(url)
+
+
+def test_narrated_report_is_never_claimed(db):
+    url = "https://www.erowid.org/experiences/exp.php?ID=2"
+    catalog.mark_narrated(url)
+
+    assert not catalog.claim(url)
+
+
+def test_pick_claims_each_report_once(db):
+    with closing(catalog.connect()) as conn:
+        catalog.upsert(conn, "https://a", substance="LSD", words=100)
+
+    assert catalog.pick("LSD") == "https://a"
+    assert catalog.pick("LSD") is None
+
+
+# -------------------------
+# Random fallback keeps the filters
+# -------------------------
+def test_pick_random_rejects_unknown_substance(db):
+    with pytest.raises(ValueError):
+        catalog.pick_random("lsd")
+
+
+def test_pick_random_fallback_enforces_max_words(db, monkeypatch):
+    reports = iter(["https://long", "https://short"])
+    words = {"https://long": 500, "https://short": 50}
+
+    monkeypatch.setattr(catalog, "fetch_candidate", lambda substance: next(reports))
+    monkeypatch.setattr(
+        catalog, "fetch_details",
+        lambda url: {"content": "word " * words[url]},
+    )
+
+    assert catalog.pick_random("DMT", max_words=100) == "https://short"
@@ -0,0 +1,77 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import episode
+import audio_gemini
+
+# -------------------------
+# Fixtures
+# Raw report leans LSD; cleanup drops the repeats, leaving DMT on top
+# -------------------------
+URL = "https://www.erowid.org/experiences/exp.php?ID=1"
+
+RAW_CONTENT = "I took LSD. I took LSD. LSD again. More LSD. Then DMT. DMT hit hard. DMT was strange."
+
+CLEANED_LINES = ["I took LSD.", "Then DMT.", "DMT hit hard.", "DMT was strange."]
+
+DETAILS = {
+    "title": "Checkpoint Test",
+    "author": "tester",
+    "content": RAW_CONTENT,
+    "metadata": {"gender": "Male", "age": "30"},
+}
+
+
+class CountingTTS:
+    def __init__(self):
+        self.synthesizer = SimpleNamespace(output_sample_rate=8000)
+        self.calls = 0
+
+    def tts(self, text, speaker=None):
+        self.calls += 1
+        return np.zeros(80, dtype=np.float32)
+
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    monkeypatch.setattr(episode, "WORK_DIR", str(tmp_path))
+    monkeypatch.delenv("PROFILE_DIR", raising=False)
+
+    monkeypatch.setattr(
+        audio_gemini.requests, "post",
+        lambda url, json=None: SimpleNamespace(json=lambda: {"data": DETAILS}),
+    )
+
+    def stream_clean(content):
+        yield "substance", "LSD"
+        for line in CLEANED_LINES:
+            yield "sentence", line
+
+    def clean_and_extract(content):
+        raise AssertionError("cleanup should come from the checkpoint")
+
+    monkeypatch.setattr(audio_gemini, "stream_clean", stream_clean)
+    monkeypatch.setattr(audio_gemini, "clean_and_extract", clean_and_extract)
+
+
+# -------------------------
+# Tests
+# -------------------------
+def test_stream_then_rerun_hits_audio_checkpoint(services):
+    tts = CountingTTS()
+    streamed = audio_gemini.narrate(URL, tts=tts, stream=True)
+    assert tts.calls > 0
+
+    rerun_tts = CountingTTS()
+    rerun = audio_gemini.narrate(URL, tts=rerun_tts, stream=False)
+
+    assert rerun_tts.calls == 0
+    assert rerun["primary_substance"] == streamed["primary_substance"] == "DMT"
+    assert rerun["audio_file"] == streamed["audio_file"]
@@ -0,0 +1,84 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import frontend
+
+
+# -------------------------
+# Fakes
+# FakeTTS.tts() goes through tokenizer.text_to_ids like Coqui's synthesis()
+# -------------------------
+class FakeTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def text_to_ids(self, text, language=None):
+        self.calls += 1
+        return [ord(c) % 64 for c in text]
+
+
+class FakeTTS:
+    def __init__(self):
+        model = SimpleNamespace(tokenizer=FakeTokenizer())
+        self.synthesizer = SimpleNamespace(tts_model=model, tts_config={})
+
+    def tts(self, text, speaker=None):
+        ids = self.synthesizer.tts_model.tokenizer.text_to_ids(text, language=None)
+        return np.asarray(ids, dtype=np.float32) / 64
+
+
+# -------------------------
+# LRU accounting
+# -------------------------
+def test_byte_cap_evicts_oldest():
+    tokenizer = FakeTokenizer()
+    one = frontend.TextFrontend(tokenizer, "fp", path=None)
+    one.text_to_ids("first clause")
+    entry_bytes = one.stats()["bytes"]
+    assert entry_bytes > len("first clause") * 8
+
+    cache = frontend.TextFrontend(tokenizer, "fp", path=None, max_bytes=2 * entry_bytes)
+    for text in ("first clause", "secnd clause", "third clause"):
+        cache.text_to_ids(text)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert "first clause" not in cache._entries
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "frontend_cache.json")
+    cache = frontend.TextFrontend(FakeTokenizer(), "fp", path=path)
+    ids = cache.text_to_ids("hello there")
+    cache.save()
+
+    tokenizer = FakeTokenizer()
+    reloaded = frontend.TextFrontend(tokenizer, "fp", path=path)
+    assert reloaded.text_to_ids("hello there") == ids
+    assert tokenizer.calls == 0
+
+
+# -------------------------
+# speak()
+# -------------------------
+def test_speak_matches_tts_and_hits_cache(monkeypatch):
+    monkeypatch.setattr(frontend, "_frontends", {})
+    monkeypatch.setattr(frontend.TextFrontend, "load", lambda self: None)
+
+    text = "The walls began to breathe."
+    expected = FakeTTS().tts(text)
+
+    tts = FakeTTS()
+    tokenizer = tts.synthesizer.tts_model.tokenizer
+    first = frontend.speak(tts, text, "p232")
+    second = frontend.speak(tts, text, "p232")
+
+    np.testing.assert_array_equal(first, expected)
+    np.testing.assert_array_equal(second, expected)
+    assert tokenizer.calls == 1
+    assert frontend.frontend_for(tts).stats()["hits"] == 1
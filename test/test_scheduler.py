@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import subprocess
+from contextlib import closing
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import scheduler
+
+
+# -------------------------
+# Fixtures
+# 8 cpus / 8 GB: two audio stages fit, a third waits
+# -------------------------
+@pytest.fixture
+def sched(tmp_path):
+    return scheduler.Scheduler(cpus=8, memory_mb=8000, path=str(tmp_path / "scheduler.db"))
+
+
+def waiting(sched, stage, pid=None):
+    cpus, memory_mb, _ = sched._request(stage)
+    with closing(sched._connect()) as conn:
+        return conn.execute(
+            "INSERT INTO leases (stage, priority, cpus, memory_mb, pid, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (stage, scheduler.STAGE_PROFILES[stage]["priority"], cpus, memory_mb,
+             pid or os.getpid(), time.time()),
+        ).lastrowid
+
+
+# -------------------------
+# Admission
+# -------------------------
+def test_admits_within_budget_and_frees_on_release(sched):
+    first = sched.acquire("audio")
+    second = sched.acquire("audio")
+
+    third = waiting(sched, "audio")
+    assert not sched._try_admit(third)
+
+    sched.release(first)
+    assert sched._try_admit(third)
+    sched.release(second)
+
+
+def test_higher_priority_waiter_goes_first(sched):
+    running = sched.acquire("stream")
+
+    audio = waiting(sched, "audio")
+    upload = waiting(sched, "upload")
+
+    # Both fit once stream is done, but upload drains first
+    sched.release(running)
+    assert not sched._try_admit(audio)
+    assert sched._try_admit(upload)
+    assert sched._try_admit(audio)
+
+
+def test_dead_process_leases_are_dropped(sched):
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+
+    with closing(sched._connect()) as conn:
+        conn.execute(
+            "INSERT INTO leases (stage, priority, cpus, memory_mb, pid, status, created_at) "
+            "VALUES ('stream', 1, 8, 4000, ?, 'running', ?)",
+            (child.pid, time.time()),
+        )
+
+    assert sched._try_admit(waiting(sched, "audio"))
+
+
+# -------------------------
+# Lease sizing
+# -------------------------
+def test_request_is_clamped_to_the_box(tmp_path):
+    small = scheduler.Scheduler(cpus=2, memory_mb=1000, path=str(tmp_path / "scheduler.db"))
+    lease = small.acquire("stream")
+
+    assert (lease.cpus, lease.memory_mb, lease.encoder_cpus) == (2, 1000, 1)
+    assert lease.env() == {
+        "OMP_NUM_THREADS": "1",
+        "MKL_NUM_THREADS": "1",
+        "ENCODER_THREADS": "1",
+    }
@@ -0,0 +1,120 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import video
+
+
+# -------------------------
+# Mux onto a pre-rendered background
+# ffmpeg takes every -i before the filtergraph and output options
+# -------------------------
+def test_background_mux_soft_subtitles_input_before_outputs():
+    cmd = video.background_mux_cmd(
+        "narration.wav",
+        "background.mp4",
+        None,
+        "&HFFFFFF&",
+        "out.mp4",
+        12.5,
+        "cues.srt",
+    )
+
+    inputs = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-i"]
+    assert inputs == ["narration.wav", "background.mp4", "cues.srt"]
+
+    last_input = max(i for i, arg in enumerate(cmd) if arg == "-i")
+    assert last_input < cmd.index("-filter_complex")
+
+    maps = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-map"]
+    assert maps == ["1:v", "[mix]", "2:s"]
+
+    assert cmd.index("-c:s") > cmd.index("-c:v")
+    assert cmd[cmd.index("-c:s") + 1] == "mov_text"
+    assert cmd[-1] == "out.mp4"
+
+
+def test_background_mux_without_soft_subtitles():
+    cmd = video.background_mux_cmd(
+        "narration.wav",
+        "background.mp4",
+        None,
+        "&HFFFFFF&",
+        "out.mp4",
+        12.5,
+    )
+
+    assert cmd.count("-i") == 2
+    assert "-c:s" not in cmd
+
+
+# -------------------------
+# Segment bounds
+# -------------------------
+def test_segment_bounds_merge_sub_frame_tail():
+    bounds = video.segment_bounds(120.01, 60)
+
+    assert len(bounds) == 2
+    assert bounds[-1] == (60, pytest.approx(60.01))
+
+
+def test_segment_bounds_cover_duration():
+    bounds = video.segment_bounds(150.0, 60)
+
+    assert bounds == [(0, 60), (60, 60), (120, pytest.approx(30.0))]
+    assert sum(length for start, length in bounds) == pytest.approx(150.0)
+
+
+# -------------------------
+# Output specs
+# -------------------------
+def test_output_specs_need_a_video():
+    with pytest.raises(ValueError):
+        video.load_output_specs("audio")
+
+    specs = video.load_output_specs("audio,landscape")
+    assert [spec["name"] for spec in specs] == ["audio", "landscape"]
+
+
+def test_render_multi_lists_the_primary_video_first(monkeypatch):
+    monkeypatch.setattr(video, "probe_duration", lambda path: 90.0)
+    monkeypatch.setattr(video.subprocess, "run", lambda cmd, check: None)
+
+    outputs = video.render_multi(
+        "narration.wav",
+        None,
+        "clip.mp4",
+        "music.mp3",
+        "episode",
+        "&HFFFFFF&",
+        video.load_output_specs("audio,landscape"),
+    )
+
+    assert outputs[0] == os.path.join(video.OUTPUT_DIR, "episode.mp4")
+    assert outputs[1].endswith("episode_audio.m4a")
+
+
+# -------------------------
+# Preview windows
+# -------------------------
+@pytest.mark.parametrize(
+    "value, window",
+    [
+        ("2", (0, 120)),
+        ("0.5", (0, 30)),
+        ("30-90", (30, 90)),
+        ("1:00-2:30", (60, 150)),
+        ("1:00:00-1:00:30", (3600, 3630)),
+    ],
+)
+def test_parse_window(value, window):
+    assert video.parse_window(value) == window
+
+
+@pytest.mark.parametrize("value", ["http://x", "", "0", "90-30", "1:00-1:00", "a-b"])
+def test_parse_window_rejects(value):
+    with pytest.raises(ValueError):
+        video.parse_window(value)
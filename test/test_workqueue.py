@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import workqueue
+
+
+# -------------------------
+# Fixtures
+# -------------------------
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    path = str(tmp_path / "queue.db")
+    connect = workqueue.connect
+    monkeypatch.setattr(workqueue, "connect", lambda: connect(path))
+    return path
+
+
+def job_row(job_id):
+    with workqueue.closing(workqueue.connect()) as conn:
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+# -------------------------
+# Leases
+# -------------------------
+def test_claim_leases_a_job_once(queue):
+    job_id = workqueue.submit("https://example.org/exp.php?ID=1")
+
+    job = workqueue.claim("node-a", ["audio"])
+    assert job["id"] == job_id
+    assert job["payload"]["experience_url"] == "https://example.org/exp.php?ID=1"
+
+    assert workqueue.claim("node-b", ["audio"]) is None
+    assert workqueue.claim("node-b", ["video"]) is None
+
+
+def test_expired_lease_is_taken_over(queue, monkeypatch):
+    job_id = workqueue.submit("https://example.org/exp.php?ID=1")
+
+    # Node A's lease lapses the moment it is granted
+    monkeypatch.setattr(workqueue, "LEASE_SECONDS", -1)
+    assert workqueue.claim("node-a", ["audio"])["id"] == job_id
+    monkeypatch.setattr(workqueue, "LEASE_SECONDS", 120)
+
+    job = workqueue.claim("node-b", ["audio"])
+    assert job["id"] == job_id
+    assert job_row(job_id)["node"] == "node-b"
+    assert job_row(job_id)["attempts"] == 2
+
+    # The stale owner can neither renew nor finish the job
+    assert workqueue.heartbeat(job_id, "node-a") is False
+    assert workqueue.complete(job_id, "node-a", "video", {}) is False
+    assert workqueue.claim("node-c", ["video"]) is None
+
+    assert workqueue.complete(job_id, "node-b", "video", {}) is True
+    assert job_row(job_id)["status"] == "done"
+    assert workqueue.claim("node-c", ["video"])["stage"] == "video"
+
+
+def test_lease_expiring_too_often_fails_the_job(queue, monkeypatch):
+    job_id = workqueue.submit("https://example.org/exp.php?ID=1")
+
+    monkeypatch.setattr(workqueue, "LEASE_SECONDS", -1)
+    for attempt in range(workqueue.MAX_ATTEMPTS):
+        assert workqueue.claim(f"node-{attempt}", ["audio"])["id"] == job_id
+
+    assert workqueue.claim("node-last", ["audio"]) is None
+    assert job_row(job_id)["status"] == "failed"
+    assert job_row(job_id)["error"] == "lease expired"
@@ -1,16 +1,15 @@
 import sys
 import os
 import logging
-import random
 import subprocess
 import re
+import math
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-from moviepy.editor import (
-    VideoFileClip,
-    AudioFileClip,
-    CompositeAudioClip,
-)
-from moviepy.audio.fx.all import volumex, audio_loop
+from assets import pick_asset, CLIP_FPS
+from episode import load_manifest, stage_valid, record_stage, stage_entry
 
 # -------------------------
 # Logging
@@ -19,66 +18,105 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # -------------------------
-# Args
+# Fonts (absolute paths required)
 # -------------------------
-if len(sys.argv) < 2:
-    logger.error("Usage: python video.py <tts_audio_file>")
-    sys.exit(1)
+font_path = os.path.abspath("fonts/PressStart2P-Regular.ttf")
+fonts_dir = os.path.dirname(font_path)
 
-tts_audio_file = sys.argv[1]
-base_name = os.path.splitext(os.path.basename(tts_audio_file))[0]
+# -------------------------
+# Subtitle colors per clip (ASS: &HBBGGRR&)
+# -------------------------
+SUBTITLE_COLOR_MAP = {
+    "1": "&HFF83D1&",  # neon pink
+    "2": "&H4ADFFF&",  # cyan blue
+    "3": "&HE042E5&",  # purple-magenta
+    "4": "&H7CFF4A&",  # acid green
+    "5": "&HFFD84A&",  # warm amber
+}
 
-# SRT lives next to wav (temp/)
-subtitle_file = os.path.splitext(tts_audio_file)[0] + ".srt"
+MUSIC_VOLUME = 0.05
 
 # -------------------------
-# Random assets
+# Thread budget (set by scheduler.py; unset = whole machine)
 # -------------------------
-random_music_index = random.randint(1, 7)
-random_clip_index = random.randint(1, 5)
+ENCODER_THREADS = os.getenv("ENCODER_THREADS")
+
 
-music_file = f"music/{random_music_index}.mp3"
-clip_file = f"clips/{random_clip_index}.mp4"
+def encoder_threads(default: int) -> int:
+    return int(ENCODER_THREADS) if ENCODER_THREADS else default
 
 # -------------------------
-# Fonts (absolute paths required)
+# Segment-parallel encoding
 # -------------------------
-font_path = os.path.abspath("fonts/PressStart2P-Regular.ttf")
-fonts_dir = os.path.dirname(font_path)
+OUTPUT_FPS = CLIP_FPS
+SEGMENT_THREADS = 2
 
 # -------------------------
-# Subtitle colors per clip (ASS: &HBBGGRR&)
+# Multi-output presets
+# size=WxH, aspect=W:H centre crop, start/duration window (seconds)
 # -------------------------
-SUBTITLE_COLOR_MAP = {
-    1: "&HFF83D1&",  # neon pink
-    2: "&H4ADFFF&",  # cyan blue
-    3: "&HE042E5&",  # purple-magenta
-    4: "&H7CFF4A&",  # acid green
-    5: "&HFFD84A&",  # warm amber
+OUTPUT_PRESETS = {
+    "landscape": {"size": "1920x1080", "aspect": "16:9", "bitrate": "6M"},
+    "shorts": {
+        "size": "1080x1920",
+        "aspect": "9:16",
+        "start": 0,
+        "duration": 60,
+        "bitrate": "4M",
+    },
+    "preview": {"size": "854x480", "aspect": "16:9", "bitrate": "800k"},
+    "audio": {"audio_only": True, "bitrate": "128k"},
 }
 
-subtitle_color = SUBTITLE_COLOR_MAP.get(
-    random_clip_index,
-    "&HFFFFFF&"
-)
+# -------------------------
+# QA preview (same mix + subtitle filters, cheap encode)
+# -------------------------
+PREVIEW_SIZE = "640x360"
+PREVIEW_FPS = 12
+PREVIEW_PRESET = "ultrafast"
+PREVIEW_CRF = 30
+PREVIEW_MINUTES = 2
 
 # -------------------------
 # Folders
 # -------------------------
 TEMP_DIR = "temp"
-OUTPUT_DIR = "output"
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")
+
 
-os.makedirs(TEMP_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# -------------------------
+# Episode assets
+# Picked at random on the first render of an episode and kept in its
+# manifest, so the preview, the pre-rendered background and the final
+# video share one clip, music track and subtitle colour.
+# -------------------------
+def episode_assets(work_dir: str) -> dict:
+    manifest = load_manifest(work_dir)
+    if stage_valid(manifest, "assets", {}):
+        return stage_entry(manifest, "assets")["data"]
+
+    clip = pick_asset("clips")
+    music = pick_asset("music")
+    assets = {
+        "clip": clip,
+        "music": music,
+        "subtitle_color": SUBTITLE_COLOR_MAP.get(clip["id"], "&HFFFFFF&"),
+    }
+
+    record_stage(
+        work_dir, manifest, "assets",
+        {},
+        {"clip": clip["path"], "music": music["path"]},
+        assets,
+    )
+    return assets
 
-temp_video = os.path.join(TEMP_DIR, f"{base_name}_nosubs.mp4")
-output_file = os.path.join(OUTPUT_DIR, f"{base_name}.mp4")
 
 # -------------------------
 # Clean SRT (punctuation + spacing only)
 # -------------------------
-def clean_srt(path: str):
-    logger.info("Cleaning subtitles: %s", path)
+def clean_srt(path: str, out_path: str):
+    logger.info("Cleaning subtitles: %s -> %s", path, out_path)
 
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         lines = f.readlines()
@@ -106,66 +144,302 @@ def clean_srt(path: str):
 
         cleaned.append(text + "\n")
 
-    with open(path, "w", encoding="utf-8") as f:
+    # Write a cleaned copy; the source SRT is a checkpointed artifact
+    with open(out_path, "w", encoding="utf-8") as f:
         f.writelines(cleaned)
 
+
 # -------------------------
-# Load clips
+# SRT parsing (for per-segment cue slices)
 # -------------------------
-logger.info("Loading TTS audio: %s", tts_audio_file)
-tts_clip = AudioFileClip(tts_audio_file)
+def parse_timestamp(value: str) -> float:
+    hms, ms = value.strip().split(",")
+    h, m, s = hms.split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000
+
+
+def format_timestamp(seconds: float) -> str:
+    ms = int((seconds % 1) * 1000)
+    s = int(seconds) % 60
+    m = (int(seconds) // 60) % 60
+    h = int(seconds) // 3600
+    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+
+
+def parse_srt(path: str):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        blocks = f.read().strip().split("\n\n")
+
+    cues = []
+    for block in blocks:
+        lines = [line for line in block.strip().splitlines() if line.strip()]
+        if len(lines) < 3 or "-->" not in lines[1]:
+            continue
+
+        start, end = lines[1].split("-->")
+        cues.append((
+            parse_timestamp(start),
+            parse_timestamp(end),
+            " ".join(lines[2:]),
+        ))
+
+    return cues
+
+
+def write_srt(cues, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for index, (start, end, text) in enumerate(cues, start=1):
+            f.write(
+                f"{index}\n"
+                f"{format_timestamp(start)} --> {format_timestamp(end)}\n"
+                f"{text}\n\n"
+            )
 
-logger.info("Loading background music: %s", music_file)
-music_clip = AudioFileClip(music_file)
 
-logger.info("Loading video clip: %s", clip_file)
-video_clip = VideoFileClip(clip_file)
+def slice_cues(cues, start: float, end: float):
+    # Cues overlapping [start, end), shifted so the slice starts at 0
+    sliced = []
+    for cue_start, cue_end, text in cues:
+        if cue_end <= start or cue_start >= end:
+            continue
+        sliced.append((
+            max(cue_start, start) - start,
+            min(cue_end, end) - start,
+            text,
+        ))
+    return sliced
+
 
 # -------------------------
-# Loop video to match TTS
+# Probing
 # -------------------------
-loops = int(tts_clip.duration // video_clip.duration) + 1
-video_clip = video_clip.loop(n=loops).subclip(0, tts_clip.duration)
+def probe_duration(path: str) -> float:
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "json",
+            path,
+        ],
+        check=True,
+        text=True,
+        stdout=subprocess.PIPE
+    )
+    return float(json.loads(result.stdout)["format"]["duration"])
+
+
+def mix_filter(voice: str, music: str) -> str:
+    # amix normalize=0 keeps the narration at full level like CompositeAudioClip
+    return (
+        f"[{music}]volume={MUSIC_VOLUME}[music];"
+        f"[{voice}][music]amix=inputs=2:duration=first:normalize=0[mix]"
+    )
+
 
 # -------------------------
-# Loop + mix music
+# Base render (MoviePy, from WAV)
 # -------------------------
-music_clip = audio_loop(music_clip, duration=tts_clip.duration)
-music_clip = volumex(music_clip, 0.05)
+def render_base(
+    tts_audio_file: str,
+    clip_file: str,
+    music_file: str,
+    temp_video: str,
+    clip_duration: float | None = None,
+):
+    # Imported here so the ffmpeg-only paths (and podcast.py) skip MoviePy
+    from moviepy.editor import (
+        VideoFileClip,
+        AudioFileClip,
+        CompositeAudioClip,
+    )
+    from moviepy.audio.fx.all import volumex, audio_loop
+
+    logger.info("Loading TTS audio: %s", tts_audio_file)
+    tts_clip = AudioFileClip(tts_audio_file)
+
+    logger.info("Loading background music: %s", music_file)
+    music_clip = AudioFileClip(music_file)
+
+    logger.info("Loading video clip: %s", clip_file)
+    video_clip = VideoFileClip(clip_file)
+
+    # Loop video to match TTS
+    loops = int(tts_clip.duration // (clip_duration or video_clip.duration)) + 1
+    video_clip = video_clip.loop(n=loops).subclip(0, tts_clip.duration)
+
+    # Loop + mix music
+    music_clip = audio_loop(music_clip, duration=tts_clip.duration)
+    music_clip = volumex(music_clip, MUSIC_VOLUME)
+
+    combined_audio = CompositeAudioClip([music_clip, tts_clip])
+    video_clip = video_clip.set_audio(combined_audio)
+
+    logger.info("Rendering base video (no subtitles)")
+    video_clip.write_videofile(
+        temp_video,
+        codec="libx264",
+        audio_codec="aac",
+        preset="medium",
+        threads=encoder_threads(4),
+        logger=None
+    )
+
+    video_clip.close()
+    tts_clip.close()
+    music_clip.close()
 
-combined_audio = CompositeAudioClip([music_clip, tts_clip])
-video_clip = video_clip.set_audio(combined_audio)
 
 # -------------------------
-# Export base video (NO subtitles)
+# Background pre-render
+# Looped clip + music bed encoded for a predicted upper-bound length
+# while the narration is still being synthesized (audio.py --prerender).
+# The final pass mixes in the narration, burns cues and trims.
 # -------------------------
-logger.info("Rendering base video (no subtitles)")
-video_clip.write_videofile(
-    temp_video,
-    codec="libx264",
-    audio_codec="aac",
-    preset="medium",
-    threads=4,
-    logger=None
-)
+def background_meta_file(background_file: str) -> str:
+    return os.path.splitext(background_file)[0] + ".json"
+
+
+def render_background(
+    clip_file: str,
+    clip_id: str,
+    music_file: str,
+    duration: float,
+    background_file: str,
+):
+    logger.info("Pre-rendering %.1fs background: %s", duration, background_file)
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-stream_loop", "-1",
+        "-i", clip_file,
+        "-stream_loop", "-1",
+        "-i", music_file,
+        "-filter_complex",
+        f"[0:v]fps={OUTPUT_FPS}[v];[1:a]volume={MUSIC_VOLUME}[music]",
+        "-map", "[v]",
+        "-map", "[music]",
+        "-t", f"{duration:.3f}",
+        "-c:v", "libx264",
+        "-preset", "medium",
+        # Runs next to TTS, which has until the narration ends anyway
+        "-threads", str(encoder_threads(2)),
+        "-c:a", "aac",
+        background_file,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+    with open(background_meta_file(background_file), "w", encoding="utf-8") as f:
+        json.dump({"clip": clip_id, "duration": duration}, f)
+
+
+def background_mux_cmd(
+    tts_audio_file: str,
+    background_file: str,
+    subtitle_file: str | None,
+    subtitle_color: str,
+    output_file: str,
+    duration: float,
+    soft_subtitle_file: str | None = None,
+) -> list:
+    # Inputs: 0 narration, 1 background, 2 soft subtitles (optional)
+    subtitle_input = []
+    subtitle_args = []
+    if soft_subtitle_file:
+        subtitle_input = ["-i", soft_subtitle_file]
+        subtitle_args = soft_subtitle_args(2)
+
+    # The bed is already at MUSIC_VOLUME
+    filters = ["[0:a][1:a]amix=inputs=2:duration=first:normalize=0[mix]"]
+
+    if subtitle_file:
+        filters.append(f"[1:v]{subtitle_filter(subtitle_file, subtitle_color)}[v]")
+        video_args = [
+            "-map", "[v]",
+            "-c:v", "libx264",
+            "-preset", "medium",
+            "-threads", str(encoder_threads(0)),
+        ]
+    else:
+        # Nothing to burn: trimming the tail needs no re-encode
+        video_args = ["-map", "1:v", "-c:v", "copy"]
+
+    return [
+        "ffmpeg",
+        "-y",
+        "-i", tts_audio_file,
+        "-i", background_file,
+        *subtitle_input,
+        "-filter_complex", ";".join(filters),
+        *video_args,
+        "-map", "[mix]",
+        "-c:a", "aac",
+        *subtitle_args,
+        "-t", f"{duration:.3f}",
+        output_file,
+    ]
+
+
+def render_with_background(
+    tts_audio_file: str,
+    background_file: str,
+    subtitle_file: str | None,
+    subtitle_color: str,
+    output_file: str,
+    soft_subtitle_file: str | None = None,
+):
+    duration = probe_duration(tts_audio_file)
+    logger.info("Muxing narration onto pre-rendered background (%.1fs)", duration)
+
+    ffmpeg_cmd = background_mux_cmd(
+        tts_audio_file,
+        background_file,
+        subtitle_file,
+        subtitle_color,
+        output_file,
+        duration,
+        soft_subtitle_file,
+    )
+    subprocess.run(ffmpeg_cmd, check=True)
 
-video_clip.close()
-tts_clip.close()
-music_clip.close()
 
 # -------------------------
-# Burn subtitles with FFmpeg
+# Soft subtitles
+# The cues ride along as a mov_text track: the frames are never touched,
+# so the base render is only remuxed. For players and destinations that
+# show captions themselves (YouTube gets them through yt.py --captions).
 # -------------------------
-if os.path.exists(subtitle_file):
-    clean_srt(subtitle_file)
+def soft_subtitle_args(input_index: int) -> list:
+    # Listed after any -c copy so the subtitle stream is converted
+    return [
+        "-map", f"{input_index}:s",
+        "-c:s", "mov_text",
+        "-metadata:s:s:0", "language=eng",
+    ]
 
-    logger.info(
-        "Burning subtitles | clip=%s | color=%s",
-        random_clip_index,
-        subtitle_color
-    )
 
-    subtitle_filter = (
+def mux_subtitles(temp_video: str, subtitle_file: str, output_file: str):
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-i", temp_video,
+        "-i", subtitle_file,
+        "-map", "0:v",
+        "-map", "0:a",
+        "-c", "copy",
+        *soft_subtitle_args(1),
+        output_file,
+    ]
+
+    subprocess.run(ffmpeg_cmd, check=True)
+
+
+# -------------------------
+# Burn subtitles with FFmpeg
+# -------------------------
+def subtitle_filter(subtitle_file: str, subtitle_color: str) -> str:
+    return (
         f"subtitles='{subtitle_file}':"
         f"fontsdir='{fonts_dir}':"
         f"force_style="
@@ -177,34 +451,825 @@ if os.path.exists(subtitle_file):
         f"Alignment=2'"
     )
 
+
+def burn_subtitles(temp_video: str, subtitle_file: str, output_file: str, subtitle_color: str):
     ffmpeg_cmd = [
         "ffmpeg",
         "-y",
         "-i", temp_video,
-        "-vf", subtitle_filter,
+        "-vf", subtitle_filter(subtitle_file, subtitle_color),
+        "-threads", str(encoder_threads(0)),
         "-c:a", "copy",
         output_file,
     ]
 
     subprocess.run(ffmpeg_cmd, check=True)
 
-    os.remove(temp_video)
-    os.remove(subtitle_file)
-    logger.info("Removed temp subtitle: %s", subtitle_file)
 
-else:
-    logger.warning("No subtitles found, skipping burn-in")
-    os.rename(temp_video, output_file)
+# -------------------------
+# Segment-parallel render
+# Each segment is an independent libx264 job (so it opens on a keyframe)
+# with its own slice of the looped background and its own cues burned in.
+# The mix is encoded once, and everything is joined with stream copy.
+# -------------------------
+def render_mix(tts_audio_file: str, music_file: str, mix_file: str, sample_rate: int | None = None):
+    # sample_rate: tts_audio_file is raw float32 mono PCM (stream mode)
+    pcm_args = []
+    if sample_rate:
+        pcm_args = ["-f", "f32le", "-ar", str(sample_rate), "-ac", "1"]
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        *pcm_args,
+        "-i", tts_audio_file,
+        "-stream_loop", "-1",
+        "-i", music_file,
+        "-filter_complex", mix_filter("0:a", "1:a"),
+        "-map", "[mix]",
+        "-c:a", "aac",
+        "-threads", str(encoder_threads(0)),
+        mix_file,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+
+def render_segment(
+    clip_file: str,
+    clip_offset: float,
+    length: float,
+    subtitle_file: str | None,
+    subtitle_color: str,
+    segment_file: str,
+):
+    video_filter = f"fps={OUTPUT_FPS}"
+    if subtitle_file:
+        video_filter += "," + subtitle_filter(subtitle_file, subtitle_color)
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-ss", f"{clip_offset:.3f}",
+        "-stream_loop", "-1",
+        "-i", clip_file,
+        "-t", f"{length:.3f}",
+        "-vf", video_filter,
+        "-an",
+        "-c:v", "libx264",
+        "-preset", "medium",
+        "-threads", str(min(SEGMENT_THREADS, encoder_threads(SEGMENT_THREADS))),
+        segment_file,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+
+def encode_segment(
+    index: int,
+    start: float,
+    length: float,
+    clip_file: str,
+    clip_duration: float,
+    cues,
+    subtitle_color: str,
+    segment_dir: str,
+) -> str:
+    segment_file = os.path.join(segment_dir, f"{index:04}.mp4")
+
+    segment_subtitle = None
+    segment_cues = slice_cues(cues, start, start + length)
+    if segment_cues:
+        segment_subtitle = os.path.join(segment_dir, f"{index:04}.srt")
+        write_srt(segment_cues, segment_subtitle)
+        clean_srt(segment_subtitle, segment_subtitle)
+
+    render_segment(
+        clip_file,
+        start % clip_duration,
+        length,
+        segment_subtitle,
+        subtitle_color,
+        segment_file,
+    )
+    return segment_file
+
+
+def join_segments(
+    segment_files,
+    mix_file: str,
+    segment_dir: str,
+    output_file: str,
+    soft_subtitle_file: str | None = None,
+):
+    concat_list = os.path.join(segment_dir, "segments.txt")
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for segment_file in segment_files:
+            f.write(f"file '{os.path.abspath(segment_file)}'\n")
+
+    logger.info("Joining segments: %s", output_file)
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", concat_list,
+        "-i", mix_file,
+    ]
+    if soft_subtitle_file:
+        ffmpeg_cmd += ["-i", soft_subtitle_file]
+
+    ffmpeg_cmd += [
+        "-map", "0:v",
+        "-map", "1:a",
+        "-c", "copy",
+    ]
+    if soft_subtitle_file:
+        ffmpeg_cmd += soft_subtitle_args(2)
+
+    ffmpeg_cmd += [
+        "-shortest",
+        output_file,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+    for name in os.listdir(segment_dir):
+        os.remove(os.path.join(segment_dir, name))
+    os.rmdir(segment_dir)
+
+
+def segment_workers() -> int:
+    return max(1, encoder_threads(os.cpu_count() or 1) // SEGMENT_THREADS)
+
+
+def segment_bounds(duration: float, segment_seconds: float) -> list:
+    # (start, length) per segment; a tail shorter than a frame would encode
+    # an empty segment and break the join, so it joins the previous one
+    count = math.ceil(duration / segment_seconds)
+    if count > 1 and duration - (count - 1) * segment_seconds < 1 / OUTPUT_FPS:
+        count -= 1
+
+    bounds = [(index * segment_seconds, segment_seconds) for index in range(count)]
+    start = bounds[-1][0]
+    bounds[-1] = (start, duration - start)
+    return bounds
+
+
+def render_segmented(
+    tts_audio_file: str,
+    subtitle_file: str | None,
+    clip_file: str,
+    music_file: str,
+    output_file: str,
+    subtitle_color: str,
+    segment_seconds: int,
+    workers: int | None = None,
+    clip_duration: float | None = None,
+    soft_subtitle_file: str | None = None,
+):
+    duration = probe_duration(tts_audio_file)
+    clip_duration = clip_duration or probe_duration(clip_file)
+    cues = parse_srt(subtitle_file) if subtitle_file else []
+
+    base_name = os.path.splitext(os.path.basename(output_file))[0]
+    segment_dir = os.path.join(TEMP_DIR, f"{base_name}_segments")
+    os.makedirs(segment_dir, exist_ok=True)
+
+    bounds = segment_bounds(duration, segment_seconds)
+    workers = workers or segment_workers()
+
+    logger.info(
+        "Rendering %d segments of %ds with %d workers",
+        len(bounds), segment_seconds, workers
+    )
+
+    def encode(index: int) -> str:
+        start, length = bounds[index]
+        return encode_segment(
+            index, start, length,
+            clip_file, clip_duration,
+            cues, subtitle_color, segment_dir,
+        )
+
+    mix_file = os.path.join(segment_dir, "mix.m4a")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        mix_future = pool.submit(render_mix, tts_audio_file, music_file, mix_file)
+        segment_files = list(pool.map(encode, range(len(bounds))))
+        mix_future.result()
+
+    join_segments(segment_files, mix_file, segment_dir, output_file, soft_subtitle_file)
+
 
 # -------------------------
-# Cleanup temp audio
+# Streamed render (PCM on stdin)
+# A segment is encoded as soon as the narration covering it has arrived.
+# Its cues are final by then: audio.py writes each cue before emitting
+# its samples. When the stream ends only the last segment, the audio mix
+# and a stream-copy join are left, so no full-length pass runs after
+# synthesis.
 # -------------------------
-if os.path.exists(tts_audio_file):
-    os.remove(tts_audio_file)
-    logger.info("Removed temp audio: %s", tts_audio_file)
+STREAM_SEGMENT_SECONDS = 30
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def render_stream(
+    sample_rate: int,
+    subtitle_file: str,
+    clip_file: str,
+    music_file: str,
+    output_file: str,
+    subtitle_color: str,
+    segment_seconds: int = STREAM_SEGMENT_SECONDS,
+    clip_duration: float | None = None,
+    soft_subs: bool = False,
+):
+    clip_duration = clip_duration or probe_duration(clip_file)
+
+    base_name = os.path.splitext(os.path.basename(output_file))[0]
+    segment_dir = os.path.join(TEMP_DIR, f"{base_name}_segments")
+    os.makedirs(segment_dir, exist_ok=True)
+
+    pcm_file = os.path.join(segment_dir, "narration.f32")
+    segment_bytes = segment_seconds * sample_rate * 4
+
+    logger.info(
+        "Encoding %ds segments from PCM stream @ %d Hz", segment_seconds, sample_rate
+    )
+
+    def encode(index: int, length: float) -> str:
+        start = index * segment_seconds
+        cues = []
+        if not soft_subs and os.path.exists(subtitle_file):
+            cues = parse_srt(subtitle_file)
+        return encode_segment(
+            index, start, length,
+            clip_file, clip_duration,
+            cues, subtitle_color, segment_dir,
+        )
+
+    with ThreadPoolExecutor(max_workers=segment_workers()) as pool:
+        futures = []
+        received = 0
+
+        with open(pcm_file, "wb") as pcm:
+            while True:
+                chunk = sys.stdin.buffer.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+
+                pcm.write(chunk)
+                received += len(chunk)
+
+                while received >= (len(futures) + 1) * segment_bytes:
+                    futures.append(pool.submit(encode, len(futures), segment_seconds))
+
+        # Anything shorter than a frame is trailing silence; -shortest drops it
+        tail = received / 4 / sample_rate - len(futures) * segment_seconds
+        if tail >= 1 / OUTPUT_FPS:
+            futures.append(pool.submit(encode, len(futures), tail))
+
+        mix_file = os.path.join(segment_dir, "mix.m4a")
+        mix_future = pool.submit(render_mix, pcm_file, music_file, mix_file, sample_rate)
+
+        segment_files = [future.result() for future in futures]
+        mix_future.result()
+
+    soft_subtitle_file = None
+    if soft_subs and os.path.exists(subtitle_file):
+        soft_subtitle_file = os.path.join(segment_dir, "subtitles.srt")
+        clean_srt(subtitle_file, soft_subtitle_file)
+
+    join_segments(segment_files, mix_file, segment_dir, output_file, soft_subtitle_file)
+
 
 # -------------------------
-# Done
+# QA preview render
+# Only the window is decoded: every input seeks to it (the loops by
+# their own length), and its cues are shifted to start at zero.
 # -------------------------
-logger.info("Final video ready: %s", output_file)
-print(output_file)
+def parse_window(value: str):
+    # "N" = first N minutes, "START-END" in seconds or [h:]mm:ss
+    def seconds(part: str) -> float:
+        total = 0.0
+        for field in part.strip().split(":"):
+            total = total * 60 + float(field)
+        return total
+
+    if "-" in value:
+        start, end = value.split("-", 1)
+        start, end = seconds(start), seconds(end)
+    else:
+        start, end = 0.0, float(value) * 60
+
+    if end <= start:
+        raise ValueError(f"Empty preview window: {value}")
+    return start, end
+
+
+def render_preview(
+    tts_audio_file: str,
+    subtitle_file: str | None,
+    clip_file: str,
+    music_file: str,
+    output_file: str,
+    subtitle_color: str,
+    start: float,
+    end: float,
+    clip_duration: float | None = None,
+    music_duration: float | None = None,
+):
+    end = min(end, probe_duration(tts_audio_file))
+    length = end - start
+    # Indexed assets carry their durations (see assets.py)
+    clip_duration = clip_duration or probe_duration(clip_file)
+    music_duration = music_duration or probe_duration(music_file)
+
+    width, height = PREVIEW_SIZE.split("x")
+    video_filter = f"[1:v]fps={PREVIEW_FPS},scale={width}:{height}"
+
+    preview_subtitle = None
+    cues = slice_cues(parse_srt(subtitle_file), start, end) if subtitle_file else []
+    if cues:
+        base_name = os.path.splitext(os.path.basename(output_file))[0]
+        preview_subtitle = os.path.join(TEMP_DIR, f"{base_name}.srt")
+        write_srt(cues, preview_subtitle)
+        video_filter += "," + subtitle_filter(preview_subtitle, subtitle_color)
+
+    logger.info("Rendering preview %.1fs-%.1fs: %s", start, end, output_file)
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-ss", f"{start:.3f}",
+        "-t", f"{length:.3f}",
+        "-i", tts_audio_file,
+        "-ss", f"{start % clip_duration:.3f}",
+        "-stream_loop", "-1",
+        "-i", clip_file,
+        "-ss", f"{start % music_duration:.3f}",
+        "-stream_loop", "-1",
+        "-i", music_file,
+        "-filter_complex", f"{mix_filter('0:a', '2:a')};{video_filter}[v]",
+        "-map", "[v]",
+        "-map", "[mix]",
+        "-c:v", "libx264",
+        "-preset", PREVIEW_PRESET,
+        "-crf", str(PREVIEW_CRF),
+        "-threads", str(encoder_threads(0)),
+        "-c:a", "aac",
+        "-t", f"{length:.3f}",
+        output_file,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+    if preview_subtitle:
+        os.remove(preview_subtitle)
+
+
+# -------------------------
+# Multi-output render
+# One decode of the background and one narration/music mix feed a split
+# filtergraph; every variant is encoded by the same ffmpeg process.
+# -------------------------
+def load_output_specs(value: str):
+    if value.endswith(".json"):
+        with open(value, "r", encoding="utf-8") as f:
+            specs = json.load(f)
+    else:
+        specs = []
+        for name in value.split(","):
+            name = name.strip()
+            if name not in OUTPUT_PRESETS:
+                raise ValueError(f"Unknown output preset: {name}")
+            specs.append({"name": name, **OUTPUT_PRESETS[name]})
+
+    for spec in specs:
+        if "name" not in spec:
+            raise ValueError(f"Output spec without a name: {spec}")
+
+    # The primary video is what gets uploaded
+    if all(spec.get("audio_only") for spec in specs):
+        raise ValueError("Outputs need at least one video preset")
+
+    return specs
+
+
+def render_multi(
+    tts_audio_file: str,
+    subtitle_file: str | None,
+    clip_file: str,
+    music_file: str,
+    base_name: str,
+    subtitle_color: str,
+    specs,
+):
+    duration = probe_duration(tts_audio_file)
+    cues = parse_srt(subtitle_file) if subtitle_file else []
+
+    video_specs = [spec for spec in specs if not spec.get("audio_only")]
+
+    filters = [
+        mix_filter("0:a", "2:a"),
+        f"[mix]asplit={len(specs)}" + "".join(f"[a{i}]" for i in range(len(specs))),
+    ]
+    if video_specs:
+        filters.append(
+            f"[1:v]fps={OUTPUT_FPS},trim=duration={duration:.3f},"
+            f"split={len(video_specs)}"
+            + "".join(f"[v{i}]" for i in range(len(video_specs)))
+        )
+
+    # Concurrent encoders share the thread budget (0 = ffmpeg auto)
+    output_threads = 0
+    if ENCODER_THREADS and video_specs:
+        output_threads = max(1, int(ENCODER_THREADS) // len(video_specs))
+
+    outputs = []
+    output_args = []
+    video_index = 0
+
+    for i, spec in enumerate(specs):
+        start = float(spec.get("start", 0))
+        end = min(duration, start + float(spec.get("duration", duration)))
+        window = f"start={start:.3f}:end={end:.3f}"
+
+        filters.append(f"[a{i}]atrim={window},asetpts=PTS-STARTPTS[ao{i}]")
+
+        if spec.get("audio_only"):
+            output_file = os.path.join(OUTPUT_DIR, f"{base_name}_{spec['name']}.m4a")
+            output_args += [
+                "-map", f"[ao{i}]",
+                "-c:a", "aac",
+                "-b:a", spec.get("bitrate", "128k"),
+                output_file,
+            ]
+            outputs.append(output_file)
+            continue
+
+        width, height = spec["size"].split("x")
+        aspect_w, aspect_h = spec.get("aspect", f"{width}:{height}").split(":")
+
+        video_filter = (
+            f"[v{video_index}]trim={window},setpts=PTS-STARTPTS,"
+            f"crop=w='min(iw,ih*{aspect_w}/{aspect_h})':"
+            f"h='min(ih,iw*{aspect_h}/{aspect_w})',"
+            f"scale={width}:{height}"
+        )
+        primary = video_index == 0
+        video_index += 1
+
+        # Cues are burned after crop/scale so they fit every frame shape
+        spec_cues = slice_cues(cues, start, end)
+        if spec_cues:
+            spec_subtitle = os.path.join(TEMP_DIR, f"{base_name}_{spec['name']}.srt")
+            write_srt(spec_cues, spec_subtitle)
+            video_filter += "," + subtitle_filter(spec_subtitle, subtitle_color)
+
+        filters.append(video_filter + f"[vo{i}]")
+
+        if primary:
+            output_file = os.path.join(OUTPUT_DIR, f"{base_name}.mp4")
+        else:
+            output_file = os.path.join(OUTPUT_DIR, f"{base_name}_{spec['name']}.mp4")
+
+        output_args += [
+            "-map", f"[vo{i}]",
+            "-map", f"[ao{i}]",
+            "-c:v", "libx264",
+            "-preset", spec.get("preset", "medium"),
+            "-threads", str(output_threads),
+            "-b:v", spec.get("bitrate", "6M"),
+            "-c:a", "aac",
+            "-b:a", "192k",
+            output_file,
+        ]
+        # The first video spec is the primary output, listed first
+        if primary:
+            outputs.insert(0, output_file)
+        else:
+            outputs.append(output_file)
+
+    logger.info(
+        "Rendering %d outputs from one pass: %s",
+        len(specs), ", ".join(spec["name"] for spec in specs)
+    )
+
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-y",
+        "-i", tts_audio_file,
+        "-stream_loop", "-1",
+        "-i", clip_file,
+        "-stream_loop", "-1",
+        "-i", music_file,
+        "-filter_complex", ";".join(filters),
+        *output_args,
+    ]
+    subprocess.run(ffmpeg_cmd, check=True)
+
+    for spec in specs:
+        spec_subtitle = os.path.join(TEMP_DIR, f"{base_name}_{spec['name']}.srt")
+        if os.path.exists(spec_subtitle):
+            os.remove(spec_subtitle)
+
+    return outputs
+
+
+if __name__ == "__main__":
+    # -------------------------
+    # Args
+    # -------------------------
+    parser = argparse.ArgumentParser(description="Render Lysergic Podcast video")
+    parser.add_argument("tts_audio_file", help="Narration WAV (names the output)")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read narration as raw float32 PCM from stdin instead of the WAV"
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=int,
+        default=22050,
+        help="Sample rate of the PCM stream"
+    )
+    parser.add_argument(
+        "--segment-seconds",
+        type=int,
+        help="Encode in parallel segments of this length (joined losslessly)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Parallel segment encoders (default: thread budget / threads per segment)"
+    )
+    parser.add_argument(
+        "--outputs",
+        help=(
+            "Comma-separated output presets "
+            f"({', '.join(OUTPUT_PRESETS)}) or a JSON spec file; "
+            "the first video output is the primary video"
+        )
+    )
+    parser.add_argument(
+        "--soft-subs",
+        action="store_true",
+        help="Mux subtitles as a mov_text track instead of burning them in"
+    )
+    parser.add_argument(
+        "--preview",
+        nargs="?",
+        const=str(PREVIEW_MINUTES),
+        metavar="WINDOW",
+        help=(
+            "Quick QA render: first N minutes (default "
+            f"{PREVIEW_MINUTES}) or START-END (seconds or mm:ss), "
+            f"{PREVIEW_SIZE} @ {PREVIEW_FPS} fps, {PREVIEW_PRESET}"
+        )
+    )
+    parser.add_argument(
+        "--prerender",
+        type=float,
+        metavar="SECONDS",
+        help=(
+            "Only encode the looped background + music bed for this long "
+            "(narration may not exist yet); prints the background file"
+        )
+    )
+    parser.add_argument(
+        "--background",
+        help="Pre-rendered background to mux the narration onto"
+    )
+    args = parser.parse_args()
+
+    tts_audio_file = args.tts_audio_file
+    base_name = os.path.splitext(os.path.basename(tts_audio_file))[0]
+
+    # SRT lives next to wav (episode work dir)
+    subtitle_file = os.path.splitext(tts_audio_file)[0] + ".srt"
+
+    # -------------------------
+    # Episode assets (random on first render, see episode_assets)
+    # -------------------------
+    assets = episode_assets(os.path.dirname(tts_audio_file) or ".")
+    clip = assets["clip"]
+    music = assets["music"]
+
+    music_file = music["path"]
+    clip_file = clip["path"]
+    subtitle_color = assets["subtitle_color"]
+
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    temp_video = os.path.join(TEMP_DIR, f"{base_name}_nosubs.mp4")
+    temp_subtitle = os.path.join(TEMP_DIR, f"{base_name}.srt")
+    output_file = os.path.join(OUTPUT_DIR, f"{base_name}.mp4")
+
+    # -------------------------
+    # QA preview (a window, never the final video)
+    # -------------------------
+    if args.preview and not args.stream:
+        try:
+            start, end = parse_window(args.preview)
+        except ValueError as e:
+            parser.error(str(e))
+
+        preview_file = os.path.join(
+            OUTPUT_DIR, f"{base_name}_preview_{int(start)}-{int(end)}s.mp4"
+        )
+
+        has_subtitles = os.path.exists(subtitle_file)
+        if has_subtitles:
+            clean_srt(subtitle_file, temp_subtitle)
+
+        render_preview(
+            tts_audio_file,
+            temp_subtitle if has_subtitles else None,
+            clip_file,
+            music_file,
+            preview_file,
+            subtitle_color,
+            start,
+            end,
+            clip.get("duration"),
+            music.get("duration"),
+        )
+
+        if has_subtitles:
+            os.remove(temp_subtitle)
+
+        logger.info("Preview ready: %s", preview_file)
+        print(preview_file)
+        sys.exit(0)
+
+    # -------------------------
+    # Background pre-render (lands next to the WAV, in the work dir)
+    # -------------------------
+    if args.prerender:
+        background_file = os.path.splitext(tts_audio_file)[0] + ".background.mp4"
+        render_background(
+            clip_file, clip["id"], music_file, args.prerender, background_file
+        )
+        print(background_file)
+        sys.exit(0)
+
+    # -------------------------
+    # Final mux onto a pre-rendered background
+    # -------------------------
+    if args.background and not (args.stream or args.outputs or args.segment_seconds):
+        with open(background_meta_file(args.background), "r", encoding="utf-8") as f:
+            background_meta = json.load(f)
+
+        if probe_duration(args.background) >= probe_duration(tts_audio_file):
+            subtitle_color = SUBTITLE_COLOR_MAP.get(
+                background_meta["clip"],
+                "&HFFFFFF&"
+            )
+
+            has_subtitles = os.path.exists(subtitle_file)
+            if has_subtitles:
+                clean_srt(subtitle_file, temp_subtitle)
+
+            burn = has_subtitles and not args.soft_subs
+            render_with_background(
+                tts_audio_file,
+                args.background,
+                temp_subtitle if burn else None,
+                subtitle_color,
+                output_file,
+                temp_subtitle if has_subtitles and args.soft_subs else None,
+            )
+
+            if has_subtitles:
+                os.remove(temp_subtitle)
+
+            logger.info("Final video ready: %s", output_file)
+            print(output_file)
+            sys.exit(0)
+
+        logger.warning("Pre-rendered background is shorter than the narration, rendering from scratch")
+
+    # -------------------------
+    # Streamed render (segments encoded while the narration arrives)
+    # -------------------------
+    if args.stream:
+        render_stream(
+            args.sample_rate,
+            subtitle_file,
+            clip_file,
+            music_file,
+            output_file,
+            subtitle_color,
+            clip_duration=clip.get("duration"),
+            soft_subs=args.soft_subs,
+        )
+
+        logger.info("Final video ready: %s", output_file)
+        print(output_file)
+        sys.exit(0)
+
+    # -------------------------
+    # Multi-output render (single decode + mix, split filtergraph)
+    # -------------------------
+    if args.outputs:
+        try:
+            specs = load_output_specs(args.outputs)
+        except ValueError as e:
+            parser.error(str(e))
+
+        if args.soft_subs:
+            parser.error("--outputs burns subtitles into every variant; drop --soft-subs")
+
+        has_subtitles = os.path.exists(subtitle_file)
+        if has_subtitles:
+            clean_srt(subtitle_file, temp_subtitle)
+
+        outputs = render_multi(
+            tts_audio_file,
+            temp_subtitle if has_subtitles else None,
+            clip_file,
+            music_file,
+            base_name,
+            subtitle_color,
+            specs,
+        )
+
+        if has_subtitles:
+            os.remove(temp_subtitle)
+
+        for path in outputs[1:]:
+            logger.info("Extra output ready: %s", path)
+
+        logger.info("Final video ready: %s", outputs[0])
+        print(outputs[0])
+        sys.exit(0)
+
+    # -------------------------
+    # Segment-parallel render (single pass, cues burned per segment)
+    # -------------------------
+    if args.segment_seconds:
+        has_subtitles = os.path.exists(subtitle_file)
+        if has_subtitles:
+            clean_srt(subtitle_file, temp_subtitle)
+
+        burn = has_subtitles and not args.soft_subs
+        render_segmented(
+            tts_audio_file,
+            temp_subtitle if burn else None,
+            clip_file,
+            music_file,
+            output_file,
+            subtitle_color,
+            args.segment_seconds,
+            args.workers,
+            clip.get("duration"),
+            temp_subtitle if has_subtitles and args.soft_subs else None,
+        )
+
+        if has_subtitles:
+            os.remove(temp_subtitle)
+
+        logger.info("Final video ready: %s", output_file)
+        print(output_file)
+        sys.exit(0)
+
+    # -------------------------
+    # Export base video (NO subtitles)
+    # -------------------------
+    render_base(tts_audio_file, clip_file, music_file, temp_video, clip.get("duration"))
+
+    # -------------------------
+    # Burn (or mux) subtitles
+    # -------------------------
+    if os.path.exists(subtitle_file) and args.soft_subs:
+        clean_srt(subtitle_file, temp_subtitle)
+
+        logger.info("Muxing soft subtitle track")
+        mux_subtitles(temp_video, temp_subtitle, output_file)
+
+        os.remove(temp_video)
+        os.remove(temp_subtitle)
+
+    elif os.path.exists(subtitle_file):
+        clean_srt(subtitle_file, temp_subtitle)
+
+        logger.info(
+            "Burning subtitles | clip=%s | color=%s",
+            clip["id"],
+            subtitle_color
+        )
+
+        burn_subtitles(temp_video, temp_subtitle, output_file, subtitle_color)
+
+        os.remove(temp_video)
+        os.remove(temp_subtitle)
+        logger.info("Removed temp subtitle: %s", temp_subtitle)
+
+    else:
+        logger.warning("No subtitles found, skipping burn-in")
+        os.rename(temp_video, output_file)
+
+    # -------------------------
+    # Done
+    # -------------------------
+    logger.info("Final video ready: %s", output_file)
+    print(output_file)
@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import closing
+from urllib.parse import unquote
+
+from dotenv import load_dotenv
+
+import catalog
+from episode import WORK_DIR, episode_dir, episode_lock
+from pipeline import run_audio, run_video, run_upload, PipelineError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# -------------------------
+# Config
+# Every node must see WORK_DIR (and the queue inside it) at the same path
+# -------------------------
+QUEUE_DB = os.getenv("QUEUE_DB", os.path.join(WORK_DIR, "queue.db"))
+
+# A node that misses heartbeats for this long is presumed dead
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 20
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 2
+
+STAGES = ("audio", "video", "upload")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    node TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_stage
+    ON jobs (status, stage);
+"""
+
+
+# -------------------------
+# Connection
+# -------------------------
+def connect(path: str = QUEUE_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # WAL needs shared memory, which network filesystems don't provide;
+    # the rollback journal only needs working file locks
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def node_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# -------------------------
+# Queue operations
+# -------------------------
+def enqueue(conn, stage: str, payload: dict) -> int:
+    now = time.time()
+    cursor = conn.execute(
+        "INSERT INTO jobs (stage, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+        (stage, json.dumps(payload), now, now),
+    )
+    return cursor.lastrowid
+
+
+def submit(
+    experience_url: str | None,
+    use_gemini: bool = False,
+    upload: bool = False,
+    parallel: bool = False,
+    outputs: str | None = None,
+    soft_subs: bool = False,
+) -> int:
+    payload = {
+        "experience_url": experience_url,
+        "gemini": use_gemini,
+        "upload": upload,
+        "parallel": parallel,
+        "outputs": outputs,
+        "soft_subs": soft_subs,
+    }
+    with closing(connect()) as conn:
+        return enqueue(conn, "audio", payload)
+
+
+def claim(node: str, stages) -> dict | None:
+    now = time.time()
+    placeholders = ",".join("?" for _ in stages)
+
+    conn = connect()
+    try:
+        # IMMEDIATE takes the write lock up front so two nodes
+        # never lease the same job
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Leases that expired too often are given up on
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ? "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, MAX_ATTEMPTS),
+        )
+
+        row = conn.execute(
+            f"SELECT * FROM jobs WHERE stage IN ({placeholders}) "
+            "AND (status = 'queued' OR (status = 'leased' AND lease_expires < ?)) "
+            "ORDER BY id LIMIT 1",
+            (*stages, now),
+        ).fetchone()
+
+        if row:
+            if row["status"] == "leased":
+                logger.warning(
+                    "Requeueing job %d (%s): node %s stopped heartbeating",
+                    row["id"], row["stage"], row["node"]
+                )
+
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', node = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (node, now + LEASE_SECONDS, now, row["id"]),
+            )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+
+    return {"id": row["id"], "stage": row["stage"], "payload": json.loads(row["payload"])}
+
+
+def heartbeat(job_id: int, node: str) -> bool:
+    now = time.time()
+    with closing(connect()) as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND node = ? AND status = 'leased'",
+            (now + LEASE_SECONDS, now, job_id, node),
+        )
+        return cursor.rowcount == 1
+
+
+def complete(job_id: int, node: str, next_stage: str | None, payload: dict) -> bool:
+    now = time.time()
+
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'done', payload = ?, updated_at = ? "
+            "WHERE id = ? AND node = ? AND status = 'leased'",
+            (json.dumps(payload), now, job_id, node),
+        )
+
+        # Another node took the job over; its result wins
+        owned = cursor.rowcount == 1
+        if owned and next_stage:
+            enqueue(conn, next_stage, payload)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    return owned
+
+
+def fail(job_id: int, node: str, error: str, payload: dict):
+    # The payload is kept so a retry resumes the report it already claimed
+    with closing(connect()) as conn:
+        conn.execute(
+            "UPDATE jobs SET "
+            "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "error = ?, payload = ?, node = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND node = ? AND status = 'leased'",
+            (MAX_ATTEMPTS, error, json.dumps(payload), time.time(), job_id, node),
+        )
+
+
+def retry_failed() -> int:
+    with closing(connect()) as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, "
+            "node = NULL, lease_expires = NULL, updated_at = ? WHERE status = 'failed'",
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+
+def status() -> list:
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT stage, status, COUNT(*) AS count FROM jobs "
+            "GROUP BY stage, status ORDER BY stage, status"
+        ).fetchall()
+
+
+# -------------------------
+# Stage execution
+# Artifacts land in the shared work dir; the payload carries what the
+# next stage needs and is handed on when the job completes.
+# -------------------------
+def run_job(job: dict, scheduler=None) -> str | None:
+    payload = job["payload"]
+
+    # Random jobs claim their report through the catalog, as run_episode
+    # does; the URL then rides along in the payload to later stages
+    if not payload["experience_url"]:
+        payload["experience_url"] = catalog.pick_random()
+        if not payload["experience_url"]:
+            raise PipelineError("No unnarrated report found")
+
+    # Another job for the same report (e.g. with/without Gemini) may be
+    # using the work dir on some node
+    with episode_lock(episode_dir(unquote(payload["experience_url"]))):
+        return run_stage_job(job, scheduler)
+
+
+def run_stage_job(job: dict, scheduler=None) -> str | None:
+    stage = job["stage"]
+    payload = job["payload"]
+
+    if stage == "audio":
+        payload["narration"] = run_audio(
+            payload["experience_url"],
+            use_gemini=payload["gemini"],
+            scheduler=scheduler,
+        )
+        return "video"
+
+    if stage == "video":
+        payload["video_file"] = run_video(
+            payload["narration"],
+            outputs=payload["outputs"],
+            parallel=payload["parallel"],
+            scheduler=scheduler,
+            soft_subs=payload.get("soft_subs", False),
+        )
+        return "upload" if payload["upload"] else None
+
+    if stage == "upload":
+        payload["video_id"] = run_upload(
+            payload["narration"],
+            payload["video_file"],
+            confirm_upload=lambda video_file: True,
+            scheduler=scheduler,
+            soft_subs=payload.get("soft_subs", False),
+        )
+        return None
+
+    raise PipelineError(f"Unknown stage: {stage}")
+
+
+class Heartbeat(threading.Thread):
+    def __init__(self, job_id: int, node: str):
+        super().__init__(name=f"heartbeat-{job_id}", daemon=True)
+        self.job_id = job_id
+        self.node = node
+        self._done = threading.Event()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def run(self):
+        while not self._done.wait(HEARTBEAT_SECONDS):
+            if not heartbeat(self.job_id, self.node):
+                logger.warning("Lost the lease on job %d", self.job_id)
+                return
+
+
+def work(node: str, stages, scheduler=None, exit_when_idle: bool = False):
+    logger.info("Node %s serving stages: %s", node, ", ".join(stages))
+
+    while True:
+        job = claim(node, stages)
+
+        if not job:
+            if exit_when_idle:
+                return
+            time.sleep(POLL_SECONDS)
+            continue
+
+        logger.info("Job %d: %s stage", job["id"], job["stage"])
+        beat = Heartbeat(job["id"], node)
+        beat.start()
+
+        try:
+            next_stage = run_job(job, scheduler)
+        except Exception as e:
+            # A bad job must not take the node down with it
+            logger.error("Job %d failed: %s", job["id"], e)
+            fail(job["id"], node, str(e), job["payload"])
+            continue
+        finally:
+            beat.stop()
+
+        if complete(job["id"], node, next_stage, job["payload"]):
+            logger.info("Job %d done%s", job["id"], f", queued {next_stage}" if next_stage else "")
+        else:
+            logger.warning("Job %d was taken over by another node, result dropped", job["id"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(threadName)s] [%(levelname)s] %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(description="Shared-storage work queue for render nodes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_cmd = commands.add_parser("submit", help="Queue episodes")
+    submit_cmd.add_argument("experience_urls", nargs="*", help="Experience URLs")
+    submit_cmd.add_argument("-n", "--random", type=int, default=0, help="Number of additional random episodes")
+    submit_cmd.add_argument("-y", "--yes", action="store_true", help="Upload to YouTube")
+    submit_cmd.add_argument("-g", "--gemini", action="store_true", help="Use Gemini audio script")
+    submit_cmd.add_argument("-p", "--parallel", action="store_true", help="Segment-parallel encode")
+    submit_cmd.add_argument("-o", "--outputs", help="Output presets for the video stage")
+    submit_cmd.add_argument("--soft-subs", action="store_true", help="Subtitle track + YouTube captions")
+
+    node_cmd = commands.add_parser("node", help="Run a worker node")
+    node_cmd.add_argument(
+        "-s", "--stages",
+        default=",".join(STAGES),
+        help="Comma-separated stages this node takes, e.g. audio (TTS nodes) or video,upload"
+    )
+    node_cmd.add_argument("-j", "--jobs", type=int, default=1, help="Jobs run at once on this node")
+    node_cmd.add_argument("--exit-when-idle", action="store_true", help="Stop once no job is claimable")
+
+    commands.add_parser("status", help="Counts by stage and status")
+    commands.add_parser("retry", help="Requeue failed jobs")
+
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        jobs = args.experience_urls + [None] * args.random
+        if not jobs:
+            submit_cmd.error("give experience URLs and/or --random N")
+        if args.outputs and args.soft_subs:
+            submit_cmd.error("--outputs burns subtitles into every variant; drop --soft-subs")
+
+        for url in jobs:
+            job_id = submit(
+                url, args.gemini, args.yes, args.parallel, args.outputs, args.soft_subs
+            )
+            logger.info("Queued job %d: %s", job_id, url or "random")
+
+    elif args.command == "node":
+        stages = [stage.strip() for stage in args.stages.split(",")]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            node_cmd.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+        # Artifacts (including the final videos) stay on shared storage
+        os.environ.setdefault("OUTPUT_DIR", os.path.join(WORK_DIR, "output"))
+
+        scheduler = None
+        if args.jobs > 1:
+            from scheduler import Scheduler
+            scheduler = Scheduler()
+
+        threads = [
+            threading.Thread(
+                target=work,
+                args=(f"{node_name()}-{i}", stages, scheduler, args.exit_when_idle),
+                name=f"node-{i}",
+            )
+            for i in range(args.jobs)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    elif args.command == "retry":
+        logger.info("Requeued %d failed jobs", retry_failed())
+
+    else:
+        for row in status():
+            print(f"{row['stage']:<8} {row['status']:<8} {row['count']:>5}")
+
@@ -1,11 +1,13 @@
-import sys
 import os
 import logging
+import argparse
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,26 +19,59 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 SCOPES = ["https://www.googleapis.com/auth/youtube"]
+# captions.insert needs force-ssl; only asked for when uploading captions,
+# so existing tokens keep working for plain (headless) uploads
+CAPTION_SCOPES = SCOPES + ["https://www.googleapis.com/auth/youtube.force-ssl"]
 CLIENT_SECRETS = "client_secret.json"
 TOKEN_FILE = "youtube_token.json"
 
+# Local stand-in (see loadtest.py): no OAuth, discovery doc served by the fake
+YOUTUBE_DISCOVERY_URL = os.getenv("YOUTUBE_DISCOVERY_URL")
+
+
+def get_youtube(scopes=SCOPES):
+    if YOUTUBE_DISCOVERY_URL:
+        return build(
+            "youtube", "v3",
+            developerKey="loadtest",
+            discoveryServiceUrl=YOUTUBE_DISCOVERY_URL,
+            static_discovery=False,
+            cache_discovery=False,
+        )
 
-def get_youtube():
     creds = None
+    requested = list(scopes)
 
+    # Loaded with the scopes it was granted, so refreshing never asks for more
     if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE)
+
+    if creds and not creds.has_scopes(scopes):
+        # Incremental: re-auth once for everything, old scopes included
+        missing = set(scopes) - set(creds.scopes or [])
+        logger.info("Stored YouTube token lacks %s", ", ".join(sorted(missing)))
+        requested = sorted(set(scopes) | set(creds.scopes or []))
+        creds = None
 
     if creds and creds.expired and creds.refresh_token:
         logger.info("Refreshing YouTube access token")
-        creds.refresh(Request())
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
+        try:
+            creds.refresh(Request())
+        except RefreshError as e:
+            logger.error(
+                "Could not refresh %s (%s); a browser sign-in is needed. "
+                "On a headless host, authenticate once elsewhere and copy the token over.",
+                TOKEN_FILE, e
+            )
+            creds = None
+        else:
+            with open(TOKEN_FILE, "w") as f:
+                f.write(creds.to_json())
 
     if not creds or not creds.valid:
         logger.info("Starting browser authentication flow")
         flow = InstalledAppFlow.from_client_secrets_file(
-            CLIENT_SECRETS, SCOPES
+            CLIENT_SECRETS, requested
         )
         creds = flow.run_local_server(port=0)
 
@@ -69,8 +104,41 @@ def build_description(experience_url: str | None):
     return description
 
 
-def upload_video(video_path, title, playlist_id=None, experience_url=None):
-    youtube = get_youtube()
+def upload_captions(youtube, video_id, captions_path, language="en"):
+    # Cleaned the same way as the burned-in cues
+    from video import clean_srt, TEMP_DIR
+
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    extension = os.path.splitext(captions_path)[1]
+    cleaned_path = os.path.join(TEMP_DIR, f"{video_id}_captions{extension}")
+    clean_srt(captions_path, cleaned_path)
+
+    logger.info("Uploading captions: %s", captions_path)
+    try:
+        youtube.captions().insert(
+            part="snippet",
+            body={
+                "snippet": {
+                    "videoId": video_id,
+                    "language": language,
+                    "name": "English",
+                    "isDraft": False,
+                }
+            },
+            media_body=MediaFileUpload(
+                cleaned_path,
+                mimetype="application/octet-stream",
+                resumable=True,
+            ),
+        ).execute()
+    finally:
+        os.remove(cleaned_path)
+
+    logger.info("Captions added to video: %s", video_id)
+
+
+def upload_video(video_path, title, playlist_id=None, experience_url=None, captions_path=None):
+    youtube = get_youtube(CAPTION_SCOPES if captions_path else SCOPES)
 
     body = {
         "snippet": {
@@ -131,20 +199,32 @@ def upload_video(video_path, title, playlist_id=None, experience_url=None):
 
         logger.info("Added video to playlist: %s", playlist_id)
 
+    if captions_path:
+        # The video is already up; missing captions can be added by hand
+        try:
+            upload_captions(youtube, video_id, captions_path)
+        except HttpError as e:
+            logger.error("Caption upload failed: %s", e)
+
     return video_id
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(
-            "Usage: python yt.py <video.mp4> [playlist_id] [substance] [experience_url]"
-        )
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Upload a video to YouTube")
+    parser.add_argument("video_file", help="Video to upload")
+    parser.add_argument("playlist_id", nargs="?", help="Playlist to add it to")
+    parser.add_argument("substance", nargs="?", help="Primary substance (title)")
+    parser.add_argument("experience_url", nargs="?", help="Frontend experience link")
+    parser.add_argument(
+        "--captions",
+        help="SRT/VTT to upload as the caption track (for soft-subtitle renders)"
+    )
+    args = parser.parse_args()
 
-    video_file = sys.argv[1]
-    playlist_id = sys.argv[2] if len(sys.argv) > 2 else None
-    substance = sys.argv[3] if len(sys.argv) > 3 else None
-    experience_url = sys.argv[4] if len(sys.argv) > 4 else None
+    video_file = args.video_file
+    playlist_id = args.playlist_id or None
+    substance = args.substance
+    experience_url = args.experience_url
 
     base_name = os.path.basename(video_file)
     base_title = os.path.splitext(base_name)[0].replace("_", " ")
@@ -154,9 +234,13 @@ if __name__ == "__main__":
     else:
         title = base_title
 
-    upload_video(
+    video_id = upload_video(
         video_file,
         title,
         playlist_id=playlist_id,
-        experience_url=experience_url
+        experience_url=experience_url,
+        captions_path=args.captions,
     )
+
+    # Output for pipeline
+    print(video_id)